@@ -0,0 +1,310 @@
+"""
+服务端报警引擎
+
+按数据流、鱼种配置置信度阈值，将连续帧中的低置信度目标合并为“事件”，
+只在事件开始、严重级别升高和结束时产生报警，并在冷却时间内抑制同一事件的重复报警，
+使报警流量与实际事件数量相关，而不是与帧率相关。
+
+阈值规则格式（alert_rules.json）:
+    {
+        "default": 0.5,
+        "species": {"GoldFish": 0.4},
+        "streams": {"camera": {"default": 0.6, "species": {"ClownFish": 0.7}}}
+    }
+数据流规则先按流名称（流ID中“#”之前的部分，例如 camera-lobby）匹配，再按流类型（“-”之前的部分，
+例如 camera、image、video）匹配。“#”之后为连接编号，使同名的多个连接各自拥有独立的事件。
+"""
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+
+# 流ID中流名称与连接编号的分隔符，例如 camera-lobby#3
+INSTANCE_SEPARATOR = "#"
+# 默认置信度阈值，低于该值的目标视为低置信度
+DEFAULT_THRESHOLD = 0.5
+# 同一事件两次观测的最大间隔（秒），超过则视为事件结束
+INCIDENT_WINDOW = 3.0
+# 事件结束后同一数据流、同一鱼种再次出现时不重新报警的冷却时间（秒）
+COOLDOWN = 15.0
+# 新事件的合并窗口（秒），窗口内的多个新事件合并为一条报警消息
+COALESCE_WINDOW = 1.0
+
+SEVERITY_LEVELS = ("info", "warning", "critical")
+SEVERITY_NAMES = {"info": "提示", "warning": "警告", "critical": "严重"}
+# 严重级别判定：置信度与阈值的比值、单帧目标数、持续帧数
+WARNING_CONFIDENCE_RATIO = 0.8
+CRITICAL_CONFIDENCE_RATIO = 0.5
+WARNING_COUNT = 2
+CRITICAL_COUNT = 5
+CRITICAL_FRAMES = 50
+
+
+class Incident:
+    """同一数据流、同一鱼种的一次连续低置信度事件。"""
+
+    def __init__(self, incident_id, stream, species, now):
+        self.id = incident_id
+        self.stream = stream
+        self.species = species
+        self.first_seen = now
+        self.last_seen = now
+        self.frames = 0
+        self.count = 0
+        self.max_count = 0
+        self.min_confidence = 1.0
+        self.severity = None
+        # 已报告的严重级别，None表示尚未报告
+        self.reported_severity = None
+        self.closed_at = None
+
+    def observe(self, confidences, now):
+        self.last_seen = now
+        self.frames += 1
+        self.count += len(confidences)
+        self.max_count = max(self.max_count, len(confidences))
+        self.min_confidence = min(self.min_confidence, min(confidences))
+
+    def to_dict(self, state, species_names, wall_time):
+        """
+        @param state: 报警状态，open、escalated 或 resolved。
+        @param species_names: 鱼种英文名到中文名的映射。
+        @param wall_time: 将单调时钟时间转换为可读时间字符串的函数。
+        """
+        return {
+            "id": self.id,
+            "state": state,
+            "stream": self.stream,
+            "species": self.species,
+            "species_cn": species_names.get(self.species, self.species),
+            "severity": self.severity,
+            "frames": self.frames,
+            "count": self.count,
+            "max_count": self.max_count,
+            "min_confidence": round(self.min_confidence, 4),
+            "first_seen": wall_time(self.first_seen),
+            "last_seen": wall_time(self.last_seen),
+        }
+
+
+class AlertEngine:
+    def __init__(self, rules=None, species_names=None, clock=time.monotonic):
+        """
+        初始化报警引擎。
+
+        @param rules: 阈值规则字典，格式见模块说明。
+        @param species_names: 鱼种英文名到中文名的映射，用于生成报警文本。
+        @param clock: 单调时钟函数。
+        """
+        self.rules = {}
+        self.set_rules(rules or {})
+        self.species_names = species_names or {}
+        self.clock = clock
+        self.incidents = {}
+        # 待发送的报警：(事件ID, 是否为结束) -> (事件, 状态)，保持加入顺序；
+        # 开始/升级与结束分开保存，事件在同一个合并窗口内开始并结束时两条都会发送
+        self.pending = {}
+        self.pending_since = None
+        self._ids = itertools.count(1)
+        # 单调时钟与墙上时钟的偏移，用于生成可读的时间
+        self._wall_offset = time.time() - clock()
+
+    # ========================
+    # 阈值规则
+    # ========================
+
+    def set_rules(self, rules: dict):
+        """
+        更新阈值规则。
+
+        @param rules: 阈值规则字典。
+        @raises ValueError: 规则格式错误或阈值不在 [0, 1] 区间时抛出。
+        """
+        def check(value):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 1:
+                raise ValueError(f"阈值应为0到1之间的数字: {value}")
+            return float(value)
+
+        def check_object(value, name):
+            if not isinstance(value, dict):
+                raise ValueError(f"{name} 应为JSON对象")
+            return value
+
+        def check_group(group, name):
+            check_object(group, name)
+            checked = {}
+            if "default" in group:
+                checked["default"] = check(group["default"])
+            species = check_object(group.get("species", {}), f"{name}.species")
+            checked["species"] = {species_name: check(value) for species_name, value in species.items()}
+            return checked
+
+        checked = check_group(rules, "规则")
+        streams = check_object(rules.get("streams", {}), "streams")
+        checked["streams"] = {stream: check_group(group, f"streams.{stream}") for stream, group in streams.items()}
+        self.rules = checked
+
+    def threshold_for(self, stream: str, species: str):
+        """
+        查找指定数据流、指定鱼种的置信度阈值。
+
+        查找顺序：流规则中的鱼种阈值 > 流规则默认阈值 > 全局鱼种阈值 > 全局默认阈值。
+        """
+        streams = self.rules["streams"]
+        name = stream.split(INSTANCE_SEPARATOR, 1)[0]
+        for key in (name, name.split("-", 1)[0]):
+            group = streams.get(key)
+            if group is not None:
+                if species in group["species"]:
+                    return group["species"][species]
+                if "default" in group:
+                    return group["default"]
+        if species in self.rules["species"]:
+            return self.rules["species"][species]
+        return self.rules.get("default", DEFAULT_THRESHOLD)
+
+    # ========================
+    # 观测与报警
+    # ========================
+
+    def observe(self, stream: str, detections: list):
+        """
+        记录一帧（或一张图片）的检测结果，为每个检测结果标记 alert 字段。
+
+        @param stream: 数据流ID，例如 camera-1、image、video-3。
+        @param detections: 检测结果列表，每项包含 fish_en 与 confidence。
+        @return: 本帧低置信度目标数。
+        """
+        now = self.clock()
+        low = {}
+        for detection in detections:
+            threshold = self.threshold_for(stream, detection["fish_en"])
+            detection["alert"] = detection["confidence"] < threshold
+            if detection["alert"]:
+                low.setdefault(detection["fish_en"], []).append(detection["confidence"])
+
+        for species, confidences in low.items():
+            key = (stream, species)
+            incident = self.incidents.get(key)
+            if incident is None or (incident.closed_at is not None and now - incident.closed_at > COOLDOWN):
+                if incident is not None and incident.reported_severity is not None:
+                    # 旧事件冷却结束，正式报告结束后开始新事件
+                    self._queue(incident, "resolved", now)
+                incident = self.incidents[key] = Incident(next(self._ids), stream, species, now)
+            elif incident.closed_at is not None:
+                # 冷却期内再次出现，视为同一事件的延续，不重复报警
+                incident.closed_at = None
+            incident.observe(confidences, now)
+            self._update_severity(incident, self.threshold_for(stream, species), now)
+        return sum(len(confidences) for confidences in low.values())
+
+    def _update_severity(self, incident, threshold, now):
+        ratio = incident.min_confidence / threshold if threshold else 1.0
+        if ratio < CRITICAL_CONFIDENCE_RATIO or incident.max_count >= CRITICAL_COUNT \
+                or incident.frames >= CRITICAL_FRAMES:
+            severity = "critical"
+        elif ratio < WARNING_CONFIDENCE_RATIO or incident.max_count >= WARNING_COUNT:
+            severity = "warning"
+        else:
+            severity = "info"
+        incident.severity = severity
+        if incident.reported_severity is None:
+            self._queue(incident, "open", now)
+        elif SEVERITY_LEVELS.index(severity) > SEVERITY_LEVELS.index(incident.reported_severity):
+            self._queue(incident, "escalated", now)
+
+    def _queue(self, incident, state, now):
+        # 同一事件在一个合并窗口内只保留最新的开始/升级状态；客户端尚未收到开始消息时，升级仍作为开始消息发送。
+        # 结束单独保存，不覆盖尚未发送的开始/升级，否则客户端只会收到结束而看不到严重级别
+        key = (incident.id, state == "resolved")
+        queued = self.pending.get(key)
+        if queued is not None and queued[1] == "open" and state == "escalated":
+            state = "open"
+        self.pending[key] = (incident, state)
+        if state != "resolved":
+            incident.reported_severity = incident.severity
+        if self.pending_since is None:
+            self.pending_since = now
+
+    def close_stream(self, stream: str):
+        """
+        数据流结束（连接断开或视频处理完成）时立即结束该流的全部事件。
+
+        @param stream: 数据流ID。
+        """
+        now = self.clock()
+        for key in [key for key in self.incidents if key[0] == stream]:
+            incident = self.incidents.pop(key)
+            if incident.reported_severity is not None:
+                self._queue(incident, "resolved", now)
+        # 流结束时不再等待合并窗口
+        if self.pending:
+            self.pending_since = now - COALESCE_WINDOW
+
+    def flush(self):
+        """
+        结束超时的事件、清理冷却完成的事件，并在合并窗口到期后生成一条报警消息。
+
+        @return: 待广播的报警消息字典，没有报警时返回None。
+        """
+        now = self.clock()
+        for key, incident in list(self.incidents.items()):
+            # 事件超时后先进入冷却，冷却结束仍未再次出现才报告结束
+            if incident.closed_at is None and now - incident.last_seen > INCIDENT_WINDOW:
+                incident.closed_at = now
+            elif incident.closed_at is not None and now - incident.closed_at > COOLDOWN:
+                del self.incidents[key]
+                self._queue(incident, "resolved", now)
+
+        if not self.pending or now - self.pending_since < COALESCE_WINDOW:
+            return None
+        alerts = [incident.to_dict(state, self.species_names, self._wall)
+                  for incident, state in self.pending.values()]
+        self.pending = {}
+        self.pending_since = None
+        return {"alert": self.describe(alerts), "alerts": alerts}
+
+    def _wall(self, monotonic_time):
+        return datetime.fromtimestamp(monotonic_time + self._wall_offset).strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def describe(alerts):
+        """
+        生成兼容旧客户端的报警文本。
+
+        @param alerts: 报警列表。
+        @return: 报警文本。
+        """
+        active = [alert for alert in alerts if alert["state"] != "resolved"]
+        if not active:
+            return f"低置信度事件已结束: {len(alerts)}"
+        parts = [f"{alert['species_cn']}×{alert['max_count']}（{SEVERITY_NAMES[alert['severity']]}）"
+                 for alert in active]
+        return f"识别度低于阈值的目标数: {sum(alert['max_count'] for alert in active)}，" + "，".join(parts)
+
+
+def load_rules(path):
+    """
+    从文件读取阈值规则，文件不存在时返回默认规则。
+
+    @param path: 规则文件路径。
+    @return: 阈值规则字典。
+    """
+    if not os.path.exists(path):
+        return {"default": DEFAULT_THRESHOLD}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_rules(path, rules):
+    """
+    保存阈值规则到文件。
+
+    @param path: 规则文件路径。
+    @param rules: 阈值规则字典。
+    """
+    temp = f"{path}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(rules, f, ensure_ascii=False, indent=2)
+    os.replace(temp, path)
@@ -0,0 +1,490 @@
+"""
+检测数据的增量时间序列汇总
+
+每次记录检测结果时同步更新按分钟、小时、天以及全量的汇总桶，
+查询时直接读取桶数据，无需重新扫描历史日志。
+
+分钟、小时桶按时间戳取整，天桶以本地时间零点为起点。
+每个汇总桶为一个紧凑列表:
+    [帧数, 目标数, 报警数, [各鱼种目标数...], [置信度直方图...]]
+鱼种下标与文件中保存的 species 列表一致，新出现的鱼种追加到列表末尾。
+
+落盘分两种：定期只把变化的桶追加到日志文件（rollups.json.journal，每行一批），
+日志达到一定行数后再重写完整的汇总文件并清空日志；加载时先读汇总文件再回放日志。
+
+对已有历史日志的回填（需在服务停止时执行，否则会被运行中服务的落盘覆盖；
+实时摄像头的数据不写入日志，回填时保留）:
+    python analytics.py backfill
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+# 各粒度的桶宽度（秒）与保留的桶数量，None表示不清理
+GRANULARITIES = {
+    "minute": (60, 24 * 60),
+    "hour": (3600, 90 * 24),
+    "day": (86400, None),
+}
+# 全量汇总只有一个桶
+TOTAL = "total"
+# 置信度直方图的分箱数，区间 [0, 1] 等分
+HISTOGRAM_BINS = 10
+# 数据来源：图片上传、视频上传、实时摄像头，以及三者合计
+SOURCES = ("image", "video", "camera")
+ALL_SOURCES = "all"
+# 可由历史日志回填的来源
+LOGGED_SOURCES = ("image", "video")
+# 视频每隔多少帧检测一次，与 main.VIDEO_SAMPLE_INTERVAL 一致，回填时用于还原逐帧记录
+VIDEO_SAMPLE_INTERVAL = 5
+# 旧日志没有 alert 字段时判定报警使用的置信度阈值
+DEFAULT_THRESHOLD = 0.5
+# 汇总文件格式版本，版本1的天桶以UTC零点为起点
+FILE_VERSION = 2
+# 增量日志达到该行数后重写完整汇总文件
+COMPACT_JOURNAL_LINES = 360
+
+EVENTS, DETECTIONS, ALERTS, SPECIES, HISTOGRAM = range(5)
+
+
+def parse_log_timestamp(timestamp: str):
+    """
+    解析日志中的时间戳，兼容旧日志中 "2025 - 04 - 14 21:03:25" 的格式。
+
+    @param timestamp: 时间字符串。
+    @return: datetime对象。
+    """
+    return datetime.strptime(timestamp.replace(" - ", "-"), "%Y-%m-%d %H:%M:%S")
+
+
+def _local_midnight(day):
+    return int(datetime(day.year, day.month, day.day).timestamp())
+
+
+def bucket_key(granularity, ts):
+    """
+    计算时间戳所在桶的起始时间戳。
+
+    @param granularity: minute、hour、day 或 total。
+    @param ts: 时间戳（秒）。
+    @return: 桶起始时间戳；天桶为本地时间零点，全量汇总为0。
+    """
+    if granularity == TOTAL:
+        return 0
+    if granularity == "day":
+        return _local_midnight(datetime.fromtimestamp(ts).date())
+    size = GRANULARITIES[granularity][0]
+    return ts - ts % size
+
+
+def _bucket_keys(granularity, first_key, count):
+    """
+    从 first_key 开始连续的桶起始时间戳。
+
+    @param count: 桶数量，为负数时向前取 -count 个桶（含 first_key）。
+    @return: 按时间升序排列的桶起始时间戳列表。
+    """
+    step = 1 if count > 0 else -1
+    offsets = range(0, count, step)
+    if granularity == "day":
+        # 按日期递推，夏令时切换日的天桶长度不是86400秒
+        first_day = datetime.fromtimestamp(first_key).date()
+        keys = [_local_midnight(first_day + timedelta(days=offset)) for offset in offsets]
+    else:
+        size = GRANULARITIES[granularity][0]
+        keys = [first_key + size * offset for offset in offsets]
+    return sorted(keys)
+
+
+def _merge_bucket(target, bucket):
+    """将 bucket 的计数累加到 target 上。"""
+    for field in (EVENTS, DETECTIONS, ALERTS):
+        target[field] += bucket[field]
+    for field in (SPECIES, HISTOGRAM):
+        counts = target[field]
+        if len(counts) < len(bucket[field]):
+            counts.extend([0] * (len(bucket[field]) - len(counts)))
+        for i, count in enumerate(bucket[field]):
+            counts[i] += count
+
+
+class RollupStore:
+    def __init__(self, path, species):
+        """
+        初始化汇总存储，已有汇总文件时从文件加载。
+
+        @param path: 汇总文件路径。
+        @param species: 已知鱼种英文名列表，决定鱼种计数的下标顺序。
+        """
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.species = list(species)
+        self.species_index = {}
+        # tables[粒度][来源] = {桶起始时间戳: 桶}
+        self.tables = {granularity: {source: {} for source in SOURCES + (ALL_SOURCES,)}
+                       for granularity in list(GRANULARITIES) + [TOTAL]}
+        # 上次落盘以来变化的桶：(粒度, 来源, 桶起始时间戳)
+        self.changed = set()
+        # 为True时下次落盘必须重写完整文件（例如重置之后）
+        self.dirty = False
+        self.journal_lines = 0
+        # 完整文件每重写一次加一，用于丢弃重写之前生成、但之后才写入的增量
+        self.generation = 0
+        self._io_lock = threading.Lock()
+        self.load()
+        self._index_species()
+
+    def _index_species(self):
+        self.species_index = {name: i for i, name in enumerate(self.species)}
+
+    def _new_bucket(self):
+        return [0, 0, 0, [0] * len(self.species), [0] * HISTOGRAM_BINS]
+
+    def _species_slot(self, name):
+        """返回鱼种下标，遇到未知鱼种时追加到列表末尾。"""
+        index = self.species_index.get(name)
+        if index is None:
+            index = len(self.species)
+            self.species.append(name)
+            self.species_index[name] = index
+        return index
+
+    def _bucket(self, granularity, source, key):
+        table = self.tables[granularity][source]
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = self._new_bucket()
+            size, keep = GRANULARITIES.get(granularity, (None, None))
+            if keep is not None:
+                # 新桶创建时顺带清理过期的旧桶，保持内存与文件大小有界
+                cutoff = key - size * keep
+                while table:
+                    oldest = next(iter(table))
+                    if oldest > cutoff:
+                        break
+                    del table[oldest]
+        return bucket
+
+    # ========================
+    # 写入
+    # ========================
+
+    def record(self, source, detections, alert_count, when=None):
+        """
+        记录一次检测（一帧或一张图片）的结果。
+
+        @param source: 数据来源，image、video 或 camera。
+        @param detections: 检测结果列表，每项包含 fish_en 与 confidence。
+        @param alert_count: 本次检测的报警数。
+        @param when: 检测时间（datetime），默认为当前时间。
+        """
+        ts = int((when or datetime.now()).timestamp())
+        slots = [self._species_slot(d["fish_en"]) for d in detections]
+        bins = [min(int(d["confidence"] * HISTOGRAM_BINS), HISTOGRAM_BINS - 1) for d in detections]
+
+        for granularity in self.tables:
+            key = bucket_key(granularity, ts)
+            for target in (source, ALL_SOURCES):
+                bucket = self._bucket(granularity, target, key)
+                self.changed.add((granularity, target, key))
+                bucket[EVENTS] += 1
+                bucket[DETECTIONS] += len(detections)
+                bucket[ALERTS] += alert_count
+                counts = bucket[SPECIES]
+                if len(counts) < len(self.species):
+                    counts.extend([0] * (len(self.species) - len(counts)))
+                for slot in slots:
+                    counts[slot] += 1
+                histogram = bucket[HISTOGRAM]
+                for b in bins:
+                    histogram[b] += 1
+
+    def record_log_entry(self, entry: dict):
+        """
+        按历史日志条目的格式记录检测，用于回填。
+        视频按检测帧拆分为多次记录，与实时处理时逐帧记录的次数一致。
+
+        @param entry: logs.json中的一条记录。
+        """
+        when = parse_log_timestamp(entry["timestamp"])
+        detections = entry.get("detections", [])
+        if entry.get("type") != "video":
+            self.record(entry.get("type", "image"), detections, entry.get("alert_count", 0), when)
+            return
+
+        frames = {}
+        for detection in detections:
+            frames.setdefault(detection.get("frame", 0), []).append(detection)
+        if entry.get("total_frames"):
+            # 没有检测结果的采样帧同样计为一次记录
+            sampled = range(0, entry["total_frames"], VIDEO_SAMPLE_INTERVAL)
+            frame_numbers = sorted(set(sampled) | set(frames))
+        else:
+            frame_numbers = sorted(frames)
+        for frame_number in frame_numbers:
+            frame_detections = frames.get(frame_number, [])
+            alerts = sum(1 for d in frame_detections if d.get("alert", d["confidence"] < DEFAULT_THRESHOLD))
+            self.record("video", frame_detections, alerts, when)
+
+    # ========================
+    # 查询
+    # ========================
+
+    def _format_bucket(self, bucket):
+        counts = bucket[SPECIES]
+        return {
+            "events": bucket[EVENTS],
+            "detections": bucket[DETECTIONS],
+            "alerts": bucket[ALERTS],
+            "species": {self.species[i]: count for i, count in enumerate(counts) if count},
+            "confidence_histogram": list(bucket[HISTOGRAM]),
+        }
+
+    def summary(self, source=ALL_SOURCES, when=None):
+        """
+        全量与当天汇总。
+
+        @param source: 数据来源，默认为全部来源。
+        @param when: 用于确定“当天”的时间，默认为当前时间。
+        @return: 包含 total 与 today 两个汇总的字典。
+        """
+        day_key = bucket_key("day", int((when or datetime.now()).timestamp()))
+        total = self.tables[TOTAL][source].get(0)
+        today = self.tables["day"][source].get(day_key)
+        return {
+            "source": source,
+            "total": self._format_bucket(total or self._new_bucket()),
+            "today": self._format_bucket(today or self._new_bucket()),
+        }
+
+    def series(self, granularity, source=ALL_SOURCES, start=None, end=None, limit=60):
+        """
+        按粒度返回时间序列，每个桶直接按键读取，空桶补零。
+
+        @param granularity: minute、hour 或 day。
+        @param source: 数据来源，默认为全部来源。
+        @param start: 起始时间（datetime）。给出时从 start 开始向后取 limit 个桶（不超过 end），
+                      否则取 end 之前（含）的 limit 个桶。
+        @param end: 结束时间（datetime），默认为当前时间。
+        @param limit: 最多返回的桶数量。
+        @return: 按时间升序排列的桶列表。
+        """
+        table = self.tables[granularity][source]
+        end_key = bucket_key(granularity, int((end or datetime.now()).timestamp()))
+        if start is not None:
+            start_key = bucket_key(granularity, int(start.timestamp()))
+            keys = [key for key in _bucket_keys(granularity, start_key, limit) if key <= end_key]
+        else:
+            keys = _bucket_keys(granularity, end_key, -limit)
+
+        series = []
+        for key in keys:
+            bucket = table.get(key) or self._new_bucket()
+            item = self._format_bucket(bucket)
+            item["time"] = datetime.fromtimestamp(key).strftime("%Y-%m-%d %H:%M:%S")
+            series.append(item)
+        return series
+
+    # ========================
+    # 持久化
+    # ========================
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"读取汇总文件时出错: {e}")
+                data = {}
+            self._load_tables(data)
+        self._replay_journal()
+
+    def _load_tables(self, data):
+        # 以文件中的鱼种顺序为准，新的已知鱼种追加在后面
+        if data and data.get("version", 1) < FILE_VERSION:
+            # 旧格式的文件在下次落盘时整体重写
+            self.dirty = True
+        stored = data.get("species", [])
+        self.species = stored + [name for name in self.species if name not in stored]
+        for granularity, sources in data.get("tables", {}).items():
+            if granularity not in self.tables:
+                continue
+            for source, buckets in sources.items():
+                if source not in self.tables[granularity]:
+                    continue
+                table = self.tables[granularity][source] = {}
+                for key, bucket in buckets.items():
+                    key = int(key)
+                    if granularity == "day" and data.get("version", 1) < 2:
+                        # 旧版本的天桶以UTC零点为起点，转换为该时刻所在的本地日期
+                        key = bucket_key("day", key)
+                        if key in table:
+                            _merge_bucket(table[key], bucket)
+                            continue
+                    table[key] = bucket
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    delta = json.loads(line)
+                except json.JSONDecodeError:
+                    # 最后一行可能在写入过程中被中断
+                    break
+                # 鱼种列表只会追加，日志中的列表总是包含已加载的列表
+                if len(delta["species"]) > len(self.species):
+                    self.species = delta["species"]
+                for granularity, source, key, bucket in delta["buckets"]:
+                    if granularity in self.tables and source in self.tables[granularity]:
+                        self.tables[granularity][source][key] = bucket
+                self.journal_lines += 1
+        self.sort()
+
+    def needs_compaction(self):
+        """
+        @return: 下次落盘是否应重写完整文件。
+        """
+        return self.dirty or self.journal_lines >= COMPACT_JOURNAL_LINES
+
+    def take_changes(self):
+        """
+        取出上次落盘以来变化的桶并序列化为一行增量日志（在事件循环线程中调用）。
+
+        @return: (代数, 日志行)，没有变化时返回None；写入由 append_journal 完成。
+        """
+        if not self.changed:
+            return None
+        buckets = []
+        for granularity, source, key in self.changed:
+            bucket = self.tables[granularity][source].get(key)
+            # 已被过期清理的桶不再写入
+            if bucket is not None:
+                buckets.append([granularity, source, key, bucket])
+        self.changed.clear()
+        self.journal_lines += 1
+        line = json.dumps({"species": self.species, "buckets": buckets}, ensure_ascii=False, separators=(",", ":"))
+        return self.generation, line + "\n"
+
+    def append_journal(self, generation, line):
+        """
+        追加一行增量日志，可在后台线程中执行。
+
+        @param generation: take_changes 返回的代数，完整文件已在其后重写时丢弃该行。
+        @param line: take_changes 返回的日志行。
+        """
+        with self._io_lock:
+            if generation != self.generation:
+                return
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def take_snapshot(self):
+        """
+        将全部汇总序列化为完整文件内容（在事件循环线程中调用）。
+
+        @return: (代数, 文件内容)；写入由 write_snapshot 完成。
+        """
+        data = {"version": FILE_VERSION, "species": self.species, "tables": self.tables}
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        self.changed.clear()
+        self.dirty = False
+        self.journal_lines = 0
+        with self._io_lock:
+            self.generation += 1
+            return self.generation, text
+
+    def write_snapshot(self, generation, text):
+        """
+        原子替换完整汇总文件并清空增量日志，可在后台线程中执行。
+
+        @param generation: take_snapshot 返回的代数，已有更新的完整文件时跳过。
+        @param text: take_snapshot 返回的文件内容。
+        """
+        with self._io_lock:
+            if generation != self.generation:
+                return
+            temp = f"{self.path}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(temp, self.path)
+            if os.path.exists(self.journal_path):
+                os.unlink(self.journal_path)
+
+    def flush(self):
+        """
+        同步落盘（服务关闭和回填时使用）：有变化时重写完整文件并清空增量日志。
+        """
+        if not self.changed and not self.needs_compaction() and not os.path.exists(self.journal_path):
+            return
+        self.write_snapshot(*self.take_snapshot())
+
+    def reset(self, sources=None):
+        """
+        清空指定来源的汇总，并由其余来源重新合计 all。
+
+        @param sources: 要清空的来源，默认为全部来源。
+        """
+        sources = SOURCES if sources is None else sources
+        for tables in self.tables.values():
+            for source in sources:
+                tables[source].clear()
+            merged = {}
+            for source in SOURCES:
+                for key, bucket in tables[source].items():
+                    if key not in merged:
+                        merged[key] = self._new_bucket()
+                    _merge_bucket(merged[key], bucket)
+            tables[ALL_SOURCES] = merged
+        self.sort()
+        self.dirty = True
+
+    def sort(self):
+        """
+        按时间重新排列各表中的桶，过期清理依赖表内按时间升序排列。
+        """
+        for tables in self.tables.values():
+            for source, table in tables.items():
+                tables[source] = dict(sorted(table.items()))
+
+
+def backfill(log_file, rollup_file, species=()):
+    """
+    根据历史日志重建图片与视频的汇总，保留实时摄像头的汇总。
+
+    @param log_file: 历史日志文件路径。
+    @param rollup_file: 汇总文件路径。
+    @param species: 已知鱼种列表。
+    @return: 回填的日志条目数。
+    """
+    store = RollupStore(rollup_file, species)
+    store.reset(LOGGED_SOURCES)
+    with open(log_file, "r", encoding="utf-8") as f:
+        logs = json.load(f)
+    # 按时间顺序回放，保证过期桶的清理逻辑正确
+    entries = sorted((entry for entry in logs if entry.get("timestamp")),
+                     key=lambda entry: parse_log_timestamp(entry["timestamp"]))
+    for entry in entries:
+        store.record_log_entry(entry)
+    # 回填的旧桶插在摄像头的新桶之后，重新排序
+    store.sort()
+    store.flush()
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检测数据汇总工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="根据历史日志重建汇总")
+    backfill_parser.add_argument("--log", default=os.path.join("history_logs", "logs.json"), help="历史日志文件")
+    backfill_parser.add_argument("--out", default=os.path.join("history_logs", "rollups.json"), help="汇总文件")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = backfill(args.log, args.out)
+    print(f"已回填 {count} 条记录到 {args.out}，耗时 {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,755 @@
+"""
+端到端压测与基准测试脚本
+
+启动后端服务（可使用桩模型或小模型），模拟多路 WebSocket 摄像头客户端按指定帧率推流（从样例视频解码并编码为JPEG），
+同时并发请求 /upload/image、/upload/video 与 /history 接口，
+统计各接口及各处理阶段的吞吐量、p50/p95/p99 延迟、峰值内存、CPU 时间与事件循环延迟，并保存为 JSON 便于对比。
+
+加上 --local-ring 时摄像头改为本机共享内存帧源：每路启动一个 shm_producer.py 循环写入样例视频，
+客户端连接 /ws/local-detection，便于与浏览器推送 JPEG 的方式在相同指标下对比。
+
+用法示例:
+    python benchmark.py --model stub --ws-clients 4 --fps 10 --duration 60
+    python benchmark.py --model stub --ws-clients 4 --fps 10 --duration 60 --local-ring
+    python benchmark.py --model yolov8n.pt --compare bench_results/bench-20250415120000.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import urlencode
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_IMAGES_DIR = os.path.join(REPO_DIR, "history_logs", "images")
+SAMPLE_VIDEOS_DIR = os.path.join(REPO_DIR, "history_logs", "videos")
+SAMPLE_LOG_FILE = os.path.join(REPO_DIR, "history_logs", "logs.json")
+RESULTS_DIR = os.path.join(REPO_DIR, "bench_results")
+PRODUCER_SCRIPT = os.path.join(REPO_DIR, "shm_producer.py")
+
+# 事件循环延迟探针的采样间隔（秒）
+LOOP_LAG_INTERVAL = 0.05
+# 模拟客户端出错后重新连接前的等待时间（秒）
+RECONNECT_DELAY = 0.5
+# 两种摄像头接入方式的结果名称，对比时互相作为基线
+CAMERA_ENDPOINTS = {"ws_frame": "local_frame", "local_frame": "ws_frame"}
+# WebSocket 模式的JPEG质量，与 js/websocket.js 中的 frameQuality = 0.8 一致
+WS_JPEG_QUALITY = 80
+
+
+def percentile(samples, pct):
+    """
+    计算样本的百分位数（线性插值）。
+
+    @param samples: 数值列表。
+    @param pct: 百分位，取值0-100。
+    @return: 对应的百分位数，样本为空时返回None。
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(samples_ms, duration=None):
+    """
+    汇总一组延迟样本（毫秒）。
+
+    @param samples_ms: 延迟样本列表，单位毫秒。
+    @param duration: 统计时长（秒），提供时计算吞吐量。
+    @return: 包含次数、吞吐量及各百分位延迟的字典。
+    """
+    summary = {
+        "count": len(samples_ms),
+        "mean_ms": sum(samples_ms) / len(samples_ms) if samples_ms else None,
+        "p50_ms": percentile(samples_ms, 50),
+        "p95_ms": percentile(samples_ms, 95),
+        "p99_ms": percentile(samples_ms, 99),
+        "max_ms": max(samples_ms) if samples_ms else None,
+    }
+    if duration:
+        summary["throughput_per_s"] = len(samples_ms) / duration
+    return summary
+
+
+# ========================
+# 服务端：在子进程中启动被测应用
+# ========================
+
+class StubBoxes(list):
+    """桩模型的检测框集合，结构与ultralytics的Boxes保持一致。"""
+
+
+class StubBox:
+    def __init__(self, xyxy, conf, cls):
+        """
+        @param xyxy: 边界框坐标 [x1, y1, x2, y2]。
+        @param conf: 置信度。
+        @param cls: 类别索引。
+        """
+        import numpy as np
+        self.xyxy = np.array([xyxy], dtype=np.float32)
+        self.conf = np.array([conf], dtype=np.float32)
+        self.cls = np.array([cls], dtype=np.float32)
+
+
+class StubResult:
+    def __init__(self, boxes, names):
+        self.boxes = boxes
+        self.names = names
+
+
+class StubModel:
+    """
+    不依赖权重文件的桩模型，返回随机检测框并模拟固定推理耗时，
+    用于在没有GPU或模型文件的机器上测量除推理外的服务开销。
+    """
+
+    def __init__(self, latency_ms=20.0, max_boxes=3, seed=0):
+        """
+        @param latency_ms: 每次推理模拟的耗时（毫秒）。
+        @param max_boxes: 每帧最多返回的检测框数量。
+        @param seed: 随机数种子，保证多次压测结果可复现。
+        """
+        self.latency_ms = latency_ms
+        self.max_boxes = max_boxes
+        self.random = random.Random(seed)
+        self.names = None
+
+    def __call__(self, frame):
+        if self.names is None:
+            # main在模块加载过程中构造模型，此时类别表尚未定义，因此延迟到首次推理时读取
+            import main
+            self.names = dict(enumerate(main.fish_labels.keys()))
+        # 模拟推理耗时（同步阻塞，与真实模型行为一致）
+        time.sleep(self.latency_ms / 1000.0)
+        height, width = frame.shape[:2]
+        boxes = StubBoxes()
+        for _ in range(self.random.randint(0, self.max_boxes)):
+            x1 = self.random.randint(0, max(width - 2, 0))
+            y1 = self.random.randint(0, max(height - 2, 0))
+            x2 = self.random.randint(x1 + 1, width)
+            y2 = self.random.randint(y1 + 1, height)
+            boxes.append(StubBox([x1, y1, x2, y2], self.random.uniform(0.3, 1.0),
+                                 self.random.randrange(len(self.names))))
+        return [StubResult(boxes, self.names)]
+
+
+class StageTimer:
+    """按阶段收集服务端耗时样本。"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage, func):
+        """
+        包装一个同步函数，记录其每次调用的耗时。
+
+        @param stage: 阶段名称。
+        @param func: 被包装的函数。
+        @return: 包装后的函数。
+        """
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[stage].append((time.perf_counter() - start) * 1000.0)
+        return timed
+
+    def reset(self):
+        self.samples.clear()
+
+
+class TimedModule:
+    """代理一个模块对象，只对指定函数计时，其余属性原样透传。"""
+
+    def __init__(self, module, timer, stages):
+        """
+        @param module: 被代理的模块，例如cv2。
+        @param timer: StageTimer实例。
+        @param stages: 函数名到阶段名的映射。
+        """
+        self._module = module
+        for name, stage in stages.items():
+            setattr(self, name, timer.wrap(stage, getattr(module, name)))
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+def serve(args):
+    """
+    子进程入口：按压测配置加载模型并启动被测应用。
+
+    当前工作目录由父进程设置为临时目录，保证压测产生的图片、视频和日志不会污染真实的history_logs。
+    """
+    sys.path.insert(0, REPO_DIR)
+    import ultralytics
+    import uvicorn
+
+    # 在导入main之前替换YOLO构造函数，使main中的模型加载走压测指定的模型
+    original_yolo = ultralytics.YOLO
+    if args.model == "stub":
+        ultralytics.YOLO = lambda *_args, **_kwargs: StubModel(args.stub_latency_ms)
+    else:
+        ultralytics.YOLO = lambda *_args, **_kwargs: original_yolo(args.model)
+
+    import main
+    import encoding
+
+    timer = StageTimer()
+    loop_lag = []
+
+    # 给主要处理阶段挂上计时器
+    main.model = timer.wrap("inference", main.model)
+    main.draw_boxes = timer.wrap("draw_boxes", main.draw_boxes)
+    main.save_log_entry = timer.wrap("save_log", main.save_log_entry)
+    main.cv2 = TimedModule(main.cv2, timer, {"imdecode": "decode"})
+    encoding.FrameEncoder.encode = timer.wrap("encode", encoding.FrameEncoder.encode)
+    encoding.StreamingVideoWriter.write = timer.wrap("video_write", encoding.StreamingVideoWriter.write)
+
+    async def probe_loop_lag():
+        # 周期性睡眠，实际唤醒时间与预期之差即为事件循环延迟
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            loop_lag.append(max(0.0, loop.time() - expected) * 1000.0)
+
+    async def start_probe():
+        asyncio.get_running_loop().create_task(probe_loop_lag())
+
+    main.app.router.on_startup.append(start_probe)
+
+    @main.app.post("/__bench__/reset")
+    async def bench_reset():
+        timer.reset()
+        loop_lag.clear()
+        return {"status": "success"}
+
+    @main.app.get("/__bench__/stats")
+    async def bench_stats():
+        return {
+            "stages": {stage: list(samples) for stage, samples in timer.samples.items()},
+            "loop_lag_ms": list(loop_lag),
+        }
+
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ========================
+# 客户端：模拟流量
+# ========================
+
+class Recorder:
+    """按接口记录客户端侧延迟和错误。"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes_received = defaultdict(int)
+        self.recording = False
+
+    def record(self, endpoint, latency_ms, nbytes=0):
+        if self.recording:
+            self.latencies[endpoint].append(latency_ms)
+            self.bytes_received[endpoint] += nbytes
+
+    def error(self, endpoint):
+        if self.recording:
+            self.errors[endpoint] += 1
+
+
+def load_assets(max_images, max_videos):
+    """
+    读取history_logs下的样例图片与视频作为压测素材。
+
+    @return: (图片字节列表, 视频字节列表)
+    """
+    images = []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_IMAGES_DIR, "*.jpg")))[:max_images]:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    videos = []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_VIDEOS_DIR, "*.mp4")))[:max_videos]:
+        with open(path, "rb") as f:
+            videos.append(f.read())
+    if not images:
+        raise SystemExit(f"未找到样例图片: {SAMPLE_IMAGES_DIR}")
+    return images, videos
+
+
+class VideoFrameSource:
+    """
+    循环解码样例视频的帧源，WebSocket 模式与共享内存生产者使用相同的视频，
+    保证两种接入方式处理的是同样分辨率和内容的帧。
+    """
+
+    def __init__(self, path):
+        """
+        @param path: 样例视频路径。
+        """
+        import cv2
+
+        self.cv2 = cv2
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+
+    def read(self):
+        """
+        读取下一帧，到达结尾时从头循环。
+
+        @return: BGR帧。
+        @raises RuntimeError: 视频无法读取时抛出。
+        """
+        success, frame = self.cap.read()
+        if not success:
+            self.cap.set(self.cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.cap.read()
+        if not success:
+            raise RuntimeError(f"无法读取样例视频: {self.path}")
+        return frame
+
+    def encode(self, frame):
+        """按浏览器端 canvas.toBlob 的质量（0.8）编码为JPEG。"""
+        success, buffer = self.cv2.imencode(".jpg", frame, [self.cv2.IMWRITE_JPEG_QUALITY, WS_JPEG_QUALITY])
+        if not success:
+            raise RuntimeError("JPEG编码失败")
+        return buffer.tobytes()
+
+    def close(self):
+        self.cap.release()
+
+
+async def camera_client(index, args, video_paths, recorder, stop):
+    """
+    模拟一路浏览器摄像头：按固定帧率从样例视频解码一帧、编码为JPEG后发送，并等待服务端返回检测结果。
+    记录的延迟从帧解码完成开始，到客户端收到检测结果为止，与 local_camera_client 的统计口径一致。
+    出错时记录错误并重新连接，整个压测期间保持相同的发送负载。
+    """
+    import websockets
+
+    url = f"ws://127.0.0.1:{args.port}/ws/fish-detection?{encode_query(args)}"
+    interval = 1.0 / args.fps
+    # 与生产者进程的分配方式相同：第 i 路使用第 i % N 个视频
+    source = VideoFrameSource(video_paths[index % len(video_paths)])
+    next_send = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                async with websockets.connect(url, max_size=None) as ws:
+                    while not stop.is_set():
+                        # 解码与编码放到线程中执行，避免阻塞其他模拟客户端的计时
+                        frame = await asyncio.to_thread(source.read)
+                        start = time.perf_counter()
+                        payload = await asyncio.to_thread(source.encode, frame)
+                        await ws.send(payload)
+                        # 跳过广播的报警消息等其他回复，直到收到本帧的检测结果
+                        while True:
+                            message = await ws.recv()
+                            status = json.loads(message).get("status")
+                            if status == "success":
+                                break
+                            if status == "error":
+                                recorder.error("ws_frame")
+                        recorder.record("ws_frame", (time.perf_counter() - start) * 1000.0, len(message))
+                        # 按目标帧率节流；处理跟不上时不累积欠账，直接发送下一帧
+                        next_send = max(next_send + interval, time.perf_counter())
+                        await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            except Exception:
+                recorder.error("ws_frame")
+                await asyncio.sleep(RECONNECT_DELAY)
+    finally:
+        source.close()
+
+
+async def local_camera_client(index, args, recorder, stop):
+    """
+    模拟一路本机摄像头：帧由生产者进程解码后写入共享内存，服务端读取后持续推送检测结果。
+    记录的延迟为帧写入共享内存（解码完成）到客户端收到检测结果的耗时，由响应中的 frame_timestamp 计算。
+    出错时记录错误并重新连接。
+    """
+    import websockets
+
+    url = f"ws://127.0.0.1:{args.port}/ws/local-detection?{encode_query(args, ring=ring_name(index))}"
+    while not stop.is_set():
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                while not stop.is_set():
+                    message = await ws.recv()
+                    received = time.time()
+                    data = json.loads(message)
+                    # 跳过广播的报警消息
+                    if "status" not in data:
+                        continue
+                    if data["status"] != "success":
+                        recorder.error("local_frame")
+                        continue
+                    recorder.record("local_frame", (received - data["frame_timestamp"]) * 1000.0, len(message))
+        except Exception:
+            recorder.error("local_frame")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+def ring_name(index):
+    """压测使用的共享内存名称，包含进程号以免与其他压测冲突。"""
+    return f"fish-bench-{os.getpid()}-{index}"
+
+
+def start_producers(args, videos):
+    """
+    为每路本机摄像头启动一个共享内存生产者进程，并等待其创建好缓冲区。
+
+    @param videos: 样例视频路径列表。
+    @return: 生产者进程列表。
+    """
+    sys.path.insert(0, REPO_DIR)
+    from shm_ring import SharedFrameRing
+
+    producers = []
+    for i in range(args.ws_clients):
+        producers.append(subprocess.Popen(
+            [sys.executable, PRODUCER_SCRIPT, videos[i % len(videos)],
+             "--name", ring_name(i), "--fps", str(args.fps), "--loop"],
+            stdout=subprocess.DEVNULL
+        ))
+    deadline = time.monotonic() + args.startup_timeout
+    for i, producer in enumerate(producers):
+        while True:
+            try:
+                SharedFrameRing.attach(ring_name(i)).close()
+                break
+            except FileNotFoundError:
+                if producer.poll() is not None or time.monotonic() > deadline:
+                    stop_processes(producers)
+                    raise SystemExit(f"生产者 {ring_name(i)} 未能创建共享内存")
+                time.sleep(0.1)
+    return producers
+
+
+def stop_processes(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def process_cpu_seconds(pids):
+    """
+    统计一组进程的累计CPU时间（用户态+内核态），已退出的进程不计入。
+    """
+    import psutil
+
+    total = 0.0
+    for pid in pids:
+        try:
+            times = psutil.Process(pid).cpu_times()
+        except psutil.Error:
+            continue
+        total += times.user + times.system
+    return total
+
+
+def encode_query(args, **extra):
+    """生成请求返回图像编码参数的查询字符串，extra 为额外的查询参数。"""
+    params = {"format": args.format, "quality": args.quality, "scale": args.scale, **extra}
+    return urlencode({key: value for key, value in params.items() if value is not None})
+
+
+async def upload_worker(client, endpoint, assets, content_type, recorder, stop, seed, args):
+    """闭环上传工作协程：上一个请求完成后立即发起下一个。"""
+    rng = random.Random(seed)
+    query = encode_query(args)
+    while not stop.is_set():
+        payload = rng.choice(assets)
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"{endpoint}?{query}", files={"file": ("sample", payload, content_type)})
+            response.raise_for_status()
+            recorder.record(endpoint, (time.perf_counter() - start) * 1000.0, len(response.content))
+        except Exception:
+            recorder.error(endpoint)
+            await asyncio.sleep(0.1)
+
+
+async def history_worker(client, recorder, stop, seed):
+    """闭环请求历史记录接口，交替查询图片和视频记录。"""
+    rng = random.Random(seed)
+    while not stop.is_set():
+        params = {"type": rng.choice(["image", "video"])}
+        start = time.perf_counter()
+        try:
+            response = await client.get("/history", params=params)
+            response.raise_for_status()
+            recorder.record("/history", (time.perf_counter() - start) * 1000.0, len(response.content))
+        except Exception:
+            recorder.error("/history")
+            await asyncio.sleep(0.1)
+
+
+async def sample_rss(pid, peak, stop):
+    """周期性采样服务进程的常驻内存，记录峰值。"""
+    import psutil
+
+    process = psutil.Process(pid)
+    while not stop.is_set():
+        try:
+            peak["rss"] = max(peak["rss"], process.memory_info().rss)
+            peak["cpu_times"] = process.cpu_times()
+        except psutil.Error:
+            return
+        await asyncio.sleep(0.2)
+
+
+async def wait_for_server(client, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/dashboard")
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit(f"服务在{timeout}秒内未启动")
+
+
+async def drive(args, server_pid):
+    """驱动全部压测流量，返回原始统计结果。"""
+    import httpx
+
+    images, videos = load_assets(args.max_images, args.max_videos)
+    recorder = Recorder()
+    stop = asyncio.Event()
+    peak = {"rss": 0, "cpu_times": None}
+
+    # 两种摄像头接入方式使用相同的样例视频作为帧源
+    video_paths = sorted(glob.glob(os.path.join(SAMPLE_VIDEOS_DIR, "*.mp4")))[:args.max_videos]
+    if args.ws_clients and not video_paths:
+        raise SystemExit(f"模拟摄像头需要样例视频: {SAMPLE_VIDEOS_DIR}")
+    producers = []
+    if args.local_ring:
+        producers = start_producers(args, video_paths)
+    producer_pids = [producer.pid for producer in producers]
+
+    timeout = httpx.Timeout(args.request_timeout)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=timeout) as client:
+            await wait_for_server(client, args.startup_timeout)
+            result = await run_load(args, client, server_pid, producer_pids, images, videos, video_paths,
+                                    recorder, stop, peak)
+    finally:
+        stop_processes(producers)
+    return result
+
+
+async def run_load(args, client, server_pid, producer_pids, images, videos, video_paths, recorder, stop, peak):
+    """启动全部流量协程，预热后统计 args.duration 秒内的结果。"""
+    tasks = [asyncio.create_task(sample_rss(server_pid, peak, stop))]
+    for i in range(args.ws_clients):
+        if args.local_ring:
+            tasks.append(asyncio.create_task(local_camera_client(i, args, recorder, stop)))
+        else:
+            tasks.append(asyncio.create_task(camera_client(i, args, video_paths, recorder, stop)))
+    for i in range(args.image_concurrency):
+        tasks.append(asyncio.create_task(
+            upload_worker(client, "/upload/image", images, "image/jpeg", recorder, stop, i, args)))
+    if videos:
+        for i in range(args.video_concurrency):
+            tasks.append(asyncio.create_task(
+                upload_worker(client, "/upload/video", videos, "video/mp4", recorder, stop, i, args)))
+    for i in range(args.history_concurrency):
+        tasks.append(asyncio.create_task(history_worker(client, recorder, stop, i)))
+
+    # 预热结束后清空服务端统计，只记录稳定阶段
+    await asyncio.sleep(args.warmup)
+    await client.post("/__bench__/reset")
+    cpu_start = peak["cpu_times"]
+    producer_cpu_start = process_cpu_seconds(producer_pids)
+    recorder.recording = True
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    server_stats = (await client.get("/__bench__/stats")).json()
+    cpu_end = peak["cpu_times"]
+    producer_cpu_end = process_cpu_seconds(producer_pids)
+
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    cpu_seconds = None
+    if cpu_start is not None and cpu_end is not None:
+        cpu_seconds = (cpu_end.user + cpu_end.system) - (cpu_start.user + cpu_start.system)
+
+    return {
+        "elapsed_s": elapsed,
+        "endpoints": {
+            endpoint: dict(summarize(samples, elapsed),
+                           errors=recorder.errors[endpoint],
+                           bytes_per_response=(recorder.bytes_received[endpoint] / len(samples)
+                                               if samples else None))
+            for endpoint, samples in recorder.latencies.items()
+        },
+        "errors": dict(recorder.errors),
+        "stages": {stage: summarize(samples) for stage, samples in server_stats["stages"].items()},
+        "event_loop_lag": summarize(server_stats["loop_lag_ms"]),
+        "peak_rss_mb": peak["rss"] / (1024 * 1024),
+        "server_cpu_seconds": cpu_seconds,
+        # 本机帧源模式下生产者进程的CPU时间（解码视频并写入共享内存）
+        "producer_cpu_seconds": producer_cpu_end - producer_cpu_start if producer_pids else None,
+    }
+
+
+def prepare_workdir():
+    """
+    创建压测用的临时工作目录，复制现有日志使/history返回真实规模的数据。
+    """
+    workdir = tempfile.mkdtemp(prefix="fish-bench-")
+    os.makedirs(os.path.join(workdir, "history_logs", "images"))
+    os.makedirs(os.path.join(workdir, "history_logs", "videos"))
+    if os.path.exists(SAMPLE_LOG_FILE):
+        shutil.copy(SAMPLE_LOG_FILE, os.path.join(workdir, "history_logs", "logs.json"))
+    return workdir
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def compare(current, baseline):
+    """
+    打印本次结果与基线结果的差异（百分比）。
+
+    @param current: 本次压测结果。
+    @param baseline: 基线压测结果。
+    """
+    def delta(new, old):
+        if new is None or not old:
+            return "   n/a"
+        return f"{(new - old) / old * 100:+6.1f}%"
+
+    print(f"\n与基线对比（{baseline.get('started_at')}）:")
+    for section in ("endpoints", "stages"):
+        for name, stats in current[section].items():
+            old = baseline.get(section, {}).get(name) or baseline.get(section, {}).get(CAMERA_ENDPOINTS.get(name))
+            if not old:
+                continue
+            line = f"  {name:<16} p50 {delta(stats['p50_ms'], old['p50_ms'])}  p95 {delta(stats['p95_ms'], old['p95_ms'])}"
+            if "throughput_per_s" in stats:
+                line += f"  吞吐 {delta(stats['throughput_per_s'], old.get('throughput_per_s'))}"
+            print(line)
+    print(f"  {'peak_rss':<16} {delta(current['peak_rss_mb'], baseline.get('peak_rss_mb'))}")
+    print(f"  {'server_cpu':<16} {delta(current['server_cpu_seconds'], baseline.get('server_cpu_seconds'))}")
+    print(f"  {'loop_lag_p95':<16} {delta(current['event_loop_lag']['p95_ms'], baseline.get('event_loop_lag', {}).get('p95_ms'))}")
+
+
+def print_report(result):
+    def fmt(value):
+        return f"{value:8.1f}" if value is not None else "     n/a"
+
+    print(f"\n压测时长 {result['elapsed_s']:.1f}s，峰值RSS {result['peak_rss_mb']:.1f} MB")
+    cpu = f"服务端CPU {result['server_cpu_seconds']:.1f}s" if result["server_cpu_seconds"] is not None else "服务端CPU n/a"
+    if result["producer_cpu_seconds"] is not None:
+        cpu += f"，生产者CPU {result['producer_cpu_seconds']:.1f}s"
+    print(cpu)
+    print(f"{'接口/阶段':<18}{'次数':>8}{'吞吐/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in list(result["endpoints"].items()) + list(result["stages"].items()):
+        print(f"{name:<18}{stats['count']:>8}{fmt(stats.get('throughput_per_s'))}"
+              f"{fmt(stats['p50_ms'])}{fmt(stats['p95_ms'])}{fmt(stats['p99_ms'])}")
+    lag = result["event_loop_lag"]
+    print(f"{'event_loop_lag':<18}{lag['count']:>8}{'':>9}{fmt(lag['p50_ms'])}{fmt(lag['p95_ms'])}{fmt(lag['p99_ms'])}")
+    if result["errors"]:
+        print(f"错误: {result['errors']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="鱼类识别服务端到端压测")
+    parser.add_argument("--model", default="stub", help="'stub' 使用桩模型，否则为YOLO权重文件路径")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0, help="桩模型每次推理的模拟耗时")
+    parser.add_argument("--ws-clients", type=int, default=2, help="模拟的摄像头WebSocket客户端数量")
+    parser.add_argument("--fps", type=float, default=10.0, help="每路摄像头的发送帧率")
+    parser.add_argument("--local-ring", action="store_true",
+                        help="摄像头改为经共享内存环形缓冲区接入（/ws/local-detection），由样例视频生产帧")
+    parser.add_argument("--image-concurrency", type=int, default=1, help="/upload/image 并发数")
+    parser.add_argument("--video-concurrency", type=int, default=1, help="/upload/video 并发数")
+    parser.add_argument("--history-concurrency", type=int, default=1, help="/history 并发数")
+    parser.add_argument("--format", help="请求返回图像的格式：jpeg、webp 或 none，默认使用服务端默认值")
+    parser.add_argument("--quality", type=int, help="请求返回图像的编码质量")
+    parser.add_argument("--scale", type=float, help="请求返回图像的缩放比例")
+    parser.add_argument("--max-images", type=int, default=20, help="最多加载的样例图片数")
+    parser.add_argument("--max-videos", type=int, default=3, help="最多加载的样例视频数")
+    parser.add_argument("--warmup", type=float, default=5.0, help="预热时长（秒），不计入统计")
+    parser.add_argument("--duration", type=float, default=30.0, help="统计时长（秒）")
+    parser.add_argument("--request-timeout", type=float, default=300.0, help="单个HTTP请求超时（秒）")
+    parser.add_argument("--startup-timeout", type=float, default=120.0, help="等待服务启动的超时（秒）")
+    parser.add_argument("--port", type=int, default=0, help="服务端口，0表示自动选择空闲端口")
+    parser.add_argument("--output", help="结果JSON路径，默认写入bench_results/")
+    parser.add_argument("--compare", help="与之对比的历史结果JSON")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        serve(args)
+        return
+
+    if not args.port:
+        args.port = free_port()
+    workdir = prepare_workdir()
+    server_argv = [sys.executable, os.path.abspath(__file__), "--serve",
+                   "--model", args.model, "--stub-latency-ms", str(args.stub_latency_ms),
+                   "--port", str(args.port)]
+    server = subprocess.Popen(server_argv, cwd=workdir)
+    started_at = datetime.now()
+    try:
+        result = asyncio.run(drive(args, server.pid))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "started_at": started_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("serve", "output", "compare")},
+        **result,
+    }
+    print_report(result)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{started_at.strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
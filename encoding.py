@@ -0,0 +1,235 @@
+"""
+标记后帧的编码输出
+
+包括:
+    - 按客户端协商的格式（JPEG/WebP/不返回图像）、质量和缩放比例编码帧，复用缩放缓冲区；
+      安装了 PyTurboJPEG 时使用其更快的JPEG编码。
+    - 流式视频写入：边处理边写入标记后的帧，安装了 PyAV 时输出浏览器可直接播放的
+      H.264 分片MP4，否则回退到OpenCV的 avc1 / mp4v 编码。
+"""
+import base64
+from fractions import Fraction
+
+import cv2
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    _turbo_jpeg = TurboJPEG()
+except Exception:
+    # 未安装PyTurboJPEG或找不到libturbojpeg时使用OpenCV编码
+    _turbo_jpeg = None
+
+try:
+    import av
+except ImportError:
+    av = None
+
+# PyAV 可用且其 FFmpeg 含 libx264 时为True，首次打开失败后置为False
+_pyav_h264 = av is not None
+# 已输出过的视频编码器，每种只提示一次
+_announced_codecs = set()
+
+
+def _announce_codec(codec, note=""):
+    if codec not in _announced_codecs:
+        _announced_codecs.add(codec)
+        print(f"视频写入使用编码器: {codec}{note}")
+
+# 支持的输出格式，none 表示不返回图像（客户端自行绘制检测框时使用）
+FORMATS = {"jpeg": "image/jpeg", "webp": "image/webp", "none": None}
+DEFAULT_FORMAT = "jpeg"
+DEFAULT_QUALITY = 80
+DEFAULT_SCALE = 1.0
+MIN_SCALE = 0.1
+# 保存到历史记录的图片使用的JPEG质量
+STORAGE_QUALITY = 90
+# H.264编码参数：速度优先的预设与恒定质量因子
+H264_PRESET = "veryfast"
+H264_CRF = 23
+
+
+class EncodeOptions:
+    def __init__(self, format=DEFAULT_FORMAT, quality=DEFAULT_QUALITY, scale=DEFAULT_SCALE):
+        """
+        帧编码参数。
+
+        @param format: 输出格式，jpeg、webp 或 none。
+        @param quality: 编码质量，1-100。
+        @param scale: 输出缩放比例，0.1-1.0。
+        @raises ValueError: 参数无效时抛出。
+        """
+        format = (format or DEFAULT_FORMAT).lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in FORMATS:
+            raise ValueError(f"format 应为 {', '.join(FORMATS)} 之一")
+        quality = int(quality if quality is not None else DEFAULT_QUALITY)
+        if not 1 <= quality <= 100:
+            raise ValueError("quality 应在1到100之间")
+        scale = float(scale if scale is not None else DEFAULT_SCALE)
+        if not MIN_SCALE <= scale <= 1.0:
+            raise ValueError(f"scale 应在{MIN_SCALE}到1.0之间")
+        self.format = format
+        self.quality = quality
+        self.scale = scale
+
+    @property
+    def mime_type(self):
+        return FORMATS[self.format]
+
+    def to_dict(self):
+        return {"format": self.format, "quality": self.quality, "scale": self.scale, "mime_type": self.mime_type}
+
+    def __eq__(self, other):
+        return isinstance(other, EncodeOptions) and self.to_dict() == other.to_dict()
+
+
+class FrameEncoder:
+    def __init__(self, options=None):
+        """
+        帧编码器，每个客户端（或每次请求）使用一个实例，以便复用缩放缓冲区。
+
+        @param options: EncodeOptions，默认使用默认参数。
+        """
+        self.options = options or EncodeOptions()
+        self._resize_buffer = None
+
+    def _resize(self, frame):
+        if self.options.scale >= 1.0:
+            return frame
+        height, width = frame.shape[:2]
+        size = (max(1, int(width * self.options.scale)), max(1, int(height * self.options.scale)))
+        # 分辨率不变时复用上一帧的缩放缓冲区，避免每帧重新分配内存
+        if self._resize_buffer is None or self._resize_buffer.shape[1::-1] != size \
+                or self._resize_buffer.shape[2:] != frame.shape[2:]:
+            self._resize_buffer = None
+        self._resize_buffer = cv2.resize(frame, size, dst=self._resize_buffer, interpolation=cv2.INTER_AREA)
+        return self._resize_buffer
+
+    def encode(self, frame):
+        """
+        按当前参数编码帧。
+
+        @param frame: BGR格式的图像帧。
+        @return: 编码后的字节串；格式为none时返回None。
+        @raises ValueError: 编码失败时抛出。
+        """
+        if self.options.format == "none":
+            return None
+        frame = self._resize(frame)
+        if self.options.format == "jpeg":
+            if _turbo_jpeg is not None:
+                return _turbo_jpeg.encode(frame, quality=self.options.quality,
+                                          pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+            success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.options.quality])
+        else:
+            success, buffer = cv2.imencode(".webp", frame, [cv2.IMWRITE_WEBP_QUALITY, self.options.quality])
+        if not success:
+            raise ValueError("图像编码失败")
+        return buffer.tobytes()
+
+    def encode_base64(self, frame):
+        """
+        编码帧并转换为Base64字符串。
+
+        @param frame: BGR格式的图像帧。
+        @return: Base64字符串；格式为none时返回None。
+        """
+        data = self.encode(frame)
+        return base64.b64encode(data).decode("ascii") if data is not None else None
+
+
+# 保存历史记录图片使用的编码参数（原始分辨率JPEG）
+STORAGE_OPTIONS = EncodeOptions("jpeg", STORAGE_QUALITY, 1.0)
+
+
+class StreamingVideoWriter:
+    def __init__(self, path, fps):
+        """
+        流式视频写入器，在写入第一帧时根据帧尺寸打开编码器。
+
+        @param path: 输出文件路径（.mp4）。
+        @param fps: 输出帧率。
+        """
+        self.path = path
+        self.fps = fps if fps and fps > 0 else 25
+        self.frames = 0
+        self._container = None
+        self._stream = None
+        self._writer = None
+
+    def _open(self, width, height):
+        global _pyav_h264
+        if _pyav_h264:
+            try:
+                self._open_av(width, height)
+                _announce_codec("libx264 (PyAV)")
+                return
+            except Exception as e:
+                # PyAV 自带的 FFmpeg 不含 libx264 等情况，之后的写入器都直接使用OpenCV
+                if self._container is not None:
+                    try:
+                        self._container.close()
+                    except Exception:
+                        pass
+                self._container = None
+                self._stream = None
+                _pyav_h264 = False
+                print(f"PyAV 无法使用 libx264 编码，回退到OpenCV: {e}")
+        # 未安装PyAV时尝试OpenCV自带的H.264编码（pip版opencv-python通常不含），不可用时回退到mp4v
+        for codec in ("avc1", "mp4v"):
+            writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*codec), self.fps, (width, height))
+            if writer.isOpened():
+                self._writer = writer
+                _announce_codec(f"{codec} (OpenCV)", "，浏览器可能无法播放，建议安装 av" if codec == "mp4v" else "")
+                return
+            writer.release()
+        raise ValueError("无法创建视频写入器")
+
+    def _open_av(self, width, height):
+        # 分片MP4（moov前置），浏览器可边下载边播放
+        self._container = av.open(self.path, mode="w", format="mp4",
+                                  options={"movflags": "frag_keyframe+empty_moov+default_base_moof"})
+        self._stream = self._container.add_stream("libx264", rate=Fraction(self.fps).limit_denominator(1001))
+        self._stream.width = width
+        self._stream.height = height
+        self._stream.pix_fmt = "yuv420p"
+        self._stream.options = {"preset": H264_PRESET, "crf": str(H264_CRF)}
+
+    def write(self, frame):
+        """
+        写入一帧。
+
+        @param frame: BGR格式的图像帧，所有帧尺寸需一致；H.264要求宽高为偶数，奇数时裁掉最后一行/列。
+        """
+        height, width = frame.shape[:2]
+        if self._container is None and self._writer is None:
+            self._open(width & ~1, height & ~1)
+        if (width | height) & 1:
+            frame = frame[:height & ~1, :width & ~1].copy()
+        if self._container is not None:
+            video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+            for packet in self._stream.encode(video_frame):
+                self._container.mux(packet)
+        else:
+            self._writer.write(frame)
+        self.frames += 1
+
+    def close(self):
+        """
+        结束写入并关闭文件。
+        """
+        if self._container is not None:
+            for packet in self._stream.encode():
+                self._container.mux(packet)
+            self._container.close()
+            self._container = None
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -49,7 +49,9 @@ export class AlertManager {
       // 消息处理路由
       ws.onmessage = (event) => {
         const data = JSON.parse(event.data);
-        if (data.alert) this.handleBatchAlert(data.alert);
+        // 服务端已完成去重、合并与冷却，结构化报警直接展示；旧格式仍走客户端节流
+        if (data.alerts) this.handleServerAlerts(data.alerts);
+        else if (data.alert) this.handleBatchAlert(data.alert);
         if (data.detections) this.handleSmartDetection(data.detections);
       };
   
@@ -81,6 +83,29 @@ export class AlertManager {
       this.highlightLowConfidence(detections);
     }
   
+    /**
+     * 处理服务端合并后的报警事件
+     * @param {Array} alerts - 报警事件数组（state: open/escalated/resolved，severity: info/warning/critical）
+     */
+    handleServerAlerts(alerts) {
+      const stateText = { open: '发现', escalated: '升级', resolved: '结束' };
+      const severityText = { info: '提示', warning: '警告', critical: '严重' };
+      const levels = ['info', 'warning', 'critical'];
+
+      // 同一条消息中的事件合并展示，取最高严重级别
+      const active = alerts.filter(alert => alert.state !== 'resolved');
+      const shown = active.length ? active : alerts;
+      const severity = shown.reduce(
+        (max, alert) => levels.indexOf(alert.severity) > levels.indexOf(max) ? alert.severity : max,
+        'info'
+      );
+      const message = shown.map(alert =>
+        `${stateText[alert.state]}${alert.species_cn}低置信目标` +
+        `（${severityText[alert.severity]}，最低${(alert.min_confidence * 100).toFixed(0)}%，共${alert.frames}帧）`
+      ).join('，');
+      this.showAlert(message, active.length ? severity : 'resolved');
+    }
+
     /**
      * 处理批量报警（简单计数模式）
      * @param {string} alertMessage - 原始报警消息
@@ -136,8 +161,9 @@ export class AlertManager {
     /**
      * 显示可视化报警（含动画效果）
      * @param {string} message - 报警内容
+     * @param {string} [severity='warning'] - 严重级别（info/warning/critical/resolved）
      */
-    showAlert(message) {
+    showAlert(message, severity = 'warning') {
       // 清理过期历史记录（防止内存泄漏）
       const now = Date.now();
       this.alertHistory.forEach((timestamp, fingerprint) => {
@@ -148,7 +174,7 @@ export class AlertManager {
   
       // 创建报警元素
       const alertElement = document.createElement('div');
-      alertElement.className = 'alert-message';
+      alertElement.className = `alert-message alert-${severity}`;
       alertElement.innerHTML = `
         <span class="alert-icon">⚠️</span>
         <span class="alert-text">${message}</span>
@@ -187,6 +213,10 @@ export class AlertManager {
           box-shadow: 0 2px 4px rgba(0,0,0,0.1);
         }
   
+        .alert-info { background: #d1ecf1; }
+        .alert-critical { background: #f8d7da; }
+        .alert-resolved { background: #d4edda; }
+
         @keyframes slide-in {
           from { transform: translateX(100%); }
           to { transform: translateX(0); }
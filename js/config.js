@@ -16,10 +16,11 @@ export const config = {
 
   /**
    * WebSocket服务地址
+   * 前端在本地视频上自行绘制检测框，format=none 让服务端不再回传标记后的图像
    * @type {string}
-   * @example 'wss://api.example.com/ws'
+   * @example 'wss://api.example.com/ws?format=webp&quality=70&scale=0.5'
    */
-  wsUrl: 'ws://localhost:8000/ws/fish-detection',
+  wsUrl: 'ws://localhost:8000/ws/fish-detection?format=none',
 
   // ======================
   // 认证配置
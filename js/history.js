@@ -66,14 +66,21 @@ async function displayImageHistory(tableBodyId) {
         // 图片预览列
         const imageCell = document.createElement('td');
         if (entry.image_url) {
+            // 列表中显示缩略图（未生成时回退原图），点击查看原图
+            const link = document.createElement('a');
+            link.href = entry.image_url;
+            link.target = '_blank';
+
             const img = document.createElement('img');
-            img.src = entry.image_url;
+            img.src = entry.thumbnail_url || entry.image_url;
+            img.loading = 'lazy';
             Object.assign(img.style, {
                 maxWidth: '200px',
                 maxHeight: '200px',
                 objectFit: 'contain'
             });
-            imageCell.appendChild(img);
+            link.appendChild(img);
+            imageCell.appendChild(link);
         } else {
             imageCell.textContent = '无图片';
         }
@@ -108,8 +115,33 @@ async function displayVideoHistory(tableBodyId) {
         const targetCount = document.createElement('td');
         targetCount.textContent = entry.detections?.length || 0;
 
-        // 视频记录无图片列
-        row.append(serialNumber, detectionType, time, targetCount);
+        // 视频预览列：显示封面，悬停时播放低分辨率预览片段，点击打开完整视频
+        const videoCell = document.createElement('td');
+        if (entry.video_url) {
+            const link = document.createElement('a');
+            link.href = entry.video_url;
+            link.target = '_blank';
+
+            const video = document.createElement('video');
+            video.src = entry.preview_url || entry.video_url;
+            if (entry.thumbnail_url) video.poster = entry.thumbnail_url;
+            video.muted = true;
+            video.loop = true;
+            video.preload = 'none';
+            Object.assign(video.style, {
+                maxWidth: '200px',
+                maxHeight: '200px',
+                objectFit: 'contain'
+            });
+            video.addEventListener('mouseenter', () => video.play().catch(() => {}));
+            video.addEventListener('mouseleave', () => video.pause());
+            link.appendChild(video);
+            videoCell.appendChild(link);
+        } else {
+            videoCell.textContent = '无视频';
+        }
+
+        row.append(serialNumber, detectionType, time, targetCount, videoCell);
         historyTableBody.appendChild(row);
     });
 }
@@ -81,8 +81,8 @@ export class FileUploader {
       const formData = new FormData();
       formData.append('file', file);
 
-      // 执行上传请求
-      const response = await fetch(`${config.apiBase}/upload/${type}`, {
+      // 执行上传请求（结果在本地文件上绘制，不需要服务端回传标记后的图像）
+      const response = await fetch(`${config.apiBase}/upload/${type}?format=none`, {
         method: 'POST',
         headers: {
           'Authorization': 'Basic ' + btoa(`${config.credentials.username}:${config.credentials.password}`)
@@ -14,12 +14,19 @@ import base64
 from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime
 import json
+import itertools
+import time
 from fastapi.staticfiles import StaticFiles
 # 确保使用pip安装的ultralytics包
 sys.path = [p for p in sys.path if r"B:\code\ultralytics-8.0.5" not in p]
 from ultralytics import YOLO
 from ultralytics.nn.tasks import DetectionModel
 from fastapi.middleware.cors import CORSMiddleware
+from media_store import MediaStore, drop_media_references, normalize_path
+from analytics import RollupStore, GRANULARITIES, SOURCES, ALL_SOURCES
+from alert_engine import AlertEngine, DEFAULT_THRESHOLD, INSTANCE_SEPARATOR, load_rules, save_rules
+from encoding import EncodeOptions, FrameEncoder, StreamingVideoWriter, STORAGE_OPTIONS
+from shm_ring import SharedFrameRing
 
 app = FastAPI()
 security = HTTPBasic()
@@ -29,12 +36,19 @@ HISTORY_LOGS_DIR = "history_logs"
 IMAGES_DIR = os.path.join(HISTORY_LOGS_DIR, "images")
 VIDEOS_DIR = os.path.join(HISTORY_LOGS_DIR, "videos")
 LOG_FILE = os.path.join(HISTORY_LOGS_DIR, "logs.json")
+ROLLUP_FILE = os.path.join(HISTORY_LOGS_DIR, "rollups.json")
+ALERT_RULES_FILE = os.path.join(HISTORY_LOGS_DIR, "alert_rules.json")
 
 # 后续的路由和 WebSocket 处理代码
 # 创建必要的目录，如果不存在的话
 os.makedirs(IMAGES_DIR, exist_ok=True)
 os.makedirs(VIDEOS_DIR, exist_ok=True)
 
+# 媒体文件存储：按内容哈希命名、按日期分目录，后台生成缩略图并定期清理
+media_store = MediaStore(HISTORY_LOGS_DIR)
+# 清理任务的执行间隔（秒）
+RETENTION_INTERVAL = 3600
+
 # 更完善的CORS配置
 app.add_middleware(
     CORSMiddleware,
@@ -107,6 +121,37 @@ question_answer_count = 0
 # 记录当天日期，用于判断是否是当天
 current_date = datetime.now().date()
 
+# 按分钟/小时/天增量汇总的检测数据，用于数据分析接口
+rollups = RollupStore(ROLLUP_FILE, fish_labels.keys())
+# 汇总数据落盘间隔（秒）
+ROLLUP_FLUSH_INTERVAL = 10
+
+# 服务端报警引擎：按数据流、鱼种判定阈值，合并去重后再广播
+alert_engine = AlertEngine(load_rules(ALERT_RULES_FILE), fish_labels)
+# 报警引擎检查并广播待发送报警的间隔（秒）
+ALERT_FLUSH_INTERVAL = 0.25
+# 用于生成数据流ID的计数器
+stream_counter = itertools.count(1)
+
+# 视频每隔多少帧检测一次，标记后的视频也只包含这些帧
+VIDEO_SAMPLE_INTERVAL = 5
+# 本机共享内存帧源没有新帧时的轮询间隔（秒）
+LOCAL_POLL_INTERVAL = 0.002
+
+
+def new_stream_id(kind: str, name: str = None):
+    """
+    生成数据流ID，报警规则可按流名称或类型前缀配置。
+    客户端指定的名称后附加连接编号，同名的多个连接不会共用报警事件。
+
+    @param kind: 数据流类型，camera 或 video。
+    @param name: 客户端指定的名称，为空时使用自增编号。
+    @return: 形如 camera-1、camera-lobby#2 的数据流ID。
+    """
+    if name:
+        return f"{kind}-{name}{INSTANCE_SEPARATOR}{next(stream_counter)}"
+    return f"{kind}-{next(stream_counter)}"
+
 
 class ConnectionManager:
     def __init__(self):
@@ -133,8 +178,9 @@ class ConnectionManager:
     
         @param websocket: 需要断开连接的WebSocket对象。
         """
-        # 从活动连接列表中移除指定的WebSocket对象
-        self.active_connections.remove(websocket)
+        # 从活动连接列表中移除指定的WebSocket对象（广播失败时可能已被移除）
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
 
     async def send_json(self, message: dict, websocket: WebSocket):
         """
@@ -153,10 +199,17 @@ class ConnectionManager:
         @param self: 当前对象的实例。
         @param message: 要发送的消息，类型为字典。
         """
-        for connection in self.active_connections:
-            # 遍历所有活跃的连接
-            await connection.send_json(message)
-            # 异步发送JSON格式的消息到当前连接
+        # 消息只序列化一次，并发发送给所有连接，单个慢连接不阻塞其他连接
+        text = json.dumps(message, ensure_ascii=False)
+        connections = list(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_text(text) for connection in connections),
+            return_exceptions=True
+        )
+        # 移除发送失败的连接
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(connection)
 
 
 manager = ConnectionManager()
@@ -208,6 +261,93 @@ def save_log_entry(entry: dict):
         print(f"保存日志文件时出错: {e}")
 
 
+def compact_log_entries(removed_paths: set):
+    """
+    清理任务删除媒体文件后，将日志中对这些文件的引用置空，
+    保留检测记录本身以便统计。
+
+    @param removed_paths: 被删除的媒体文件路径集合。
+    """
+    if not removed_paths or not os.path.exists(LOG_FILE):
+        return
+    try:
+        with open(LOG_FILE, "r+", encoding="utf-8") as f:
+            logs = json.load(f)
+            if drop_media_references(logs, removed_paths):
+                f.seek(0)
+                json.dump(logs, f, ensure_ascii=False, indent=2)
+                f.truncate()
+        print(f"已清理媒体文件 {len(removed_paths)} 个")
+    except Exception as e:
+        print(f"压缩日志文件时出错: {e}")
+
+
+async def retention_loop():
+    """
+    定期执行媒体文件清理，文件删除在后台线程中完成，日志更新在事件循环中完成，
+    与save_log_entry不会并发修改日志文件。
+    """
+    while True:
+        try:
+            removed = await asyncio.wrap_future(media_store.schedule_retention())
+            compact_log_entries(removed)
+        except Exception as e:
+            print(f"媒体文件清理失败: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+
+async def alert_flush_loop():
+    """
+    定期从报警引擎取出合并后的报警并广播。
+    """
+    while True:
+        await asyncio.sleep(ALERT_FLUSH_INTERVAL)
+        try:
+            message = alert_engine.flush()
+            if message:
+                await manager.broadcast_alert(message)
+        except Exception as e:
+            print(f"广播报警时出错: {e}")
+
+
+async def rollup_flush_loop():
+    """
+    定期将汇总数据写回磁盘：平时只追加变化的桶，增量日志较多时重写完整文件。
+    事件循环中只做序列化，文件写入在线程池中完成。
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(ROLLUP_FLUSH_INTERVAL)
+        try:
+            if rollups.needs_compaction():
+                await loop.run_in_executor(None, rollups.write_snapshot, *rollups.take_snapshot())
+            else:
+                changes = rollups.take_changes()
+                if changes:
+                    await loop.run_in_executor(None, rollups.append_journal, *changes)
+        except Exception as e:
+            print(f"保存汇总文件时出错: {e}")
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    """
+    应用启动时启动后台清理和汇总落盘任务。
+    """
+    loop = asyncio.get_running_loop()
+    loop.create_task(retention_loop())
+    loop.create_task(rollup_flush_loop())
+    loop.create_task(alert_flush_loop())
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    """
+    应用关闭时保存尚未落盘的汇总数据。
+    """
+    rollups.flush()
+
+
 def authenticate_user(credentials: HTTPBasicCredentials = Depends(security)):
     """
     验证用户身份的函数。
@@ -234,13 +374,14 @@ def authenticate_user(credentials: HTTPBasicCredentials = Depends(security)):
     return credentials.username
 
 
-def draw_boxes(frame, detections, threshold):
+def draw_boxes(frame, detections, threshold=DEFAULT_THRESHOLD):
     """
     在图像上绘制检测框和标签。
 
     @param frame: 输入的图像帧，BGR格式。
-    @param detections: 包含检测信息的列表，每个元素是一个字典，包含bbox、confidence和fish_cn。
-    @param threshold: 置信度阈值，低于该值的检测框用红色绘制，高于该值的用绿色绘制。
+    @param detections: 包含检测信息的列表，每个元素是一个字典，包含bbox、confidence和fish_cn，
+                       经报警引擎处理后还包含alert标记。
+    @param threshold: 置信度阈值，检测结果没有alert标记时，低于该值的检测框用红色绘制，高于该值的用绿色绘制。
     @return: 带有绘制检测框和标签的图像帧，BGR格式。
     """
     # 将图像从BGR格式转换为RGB格式
@@ -260,8 +401,8 @@ def draw_boxes(frame, detections, threshold):
         conf = detection["confidence"]
         # 获取检测的标签
         label = detection["fish_cn"]
-        # 根据置信度确定绘制的颜色
-        if conf < threshold:
+        # 根据报警标记（按数据流和鱼种的阈值判定）确定绘制的颜色
+        if detection.get("alert", conf < threshold):
             color = (255, 0, 0)  # 置信度低于阈值时使用红色
         else:
             color = (0, 255, 0)  # 置信度高于阈值时使用绿色
@@ -278,6 +419,123 @@ def draw_boxes(frame, detections, threshold):
     return frame
 
 
+def parse_encode_options(format: str = None, quality: int = None, scale: float = None):
+    """
+    解析客户端请求的输出编码参数。
+
+    @param format: 输出格式，jpeg、webp 或 none（不返回图像）。
+    @param quality: 编码质量，1-100。
+    @param scale: 输出缩放比例，0.1-1.0。
+    @return: EncodeOptions对象。
+    @raises HTTPException: 参数无效时抛出400异常。
+    """
+    try:
+        return EncodeOptions(format, quality, scale)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(400, f"编码参数错误: {e}")
+
+
+async def websocket_encoder(websocket: WebSocket):
+    """
+    根据WebSocket连接地址的查询参数创建帧编码器，参数无效时通知客户端并使用默认参数。
+
+    @param websocket: 客户端的WebSocket连接对象。
+    @return: FrameEncoder对象。
+    """
+    try:
+        return FrameEncoder(parse_encode_options(
+            websocket.query_params.get("format"),
+            websocket.query_params.get("quality"),
+            websocket.query_params.get("scale")
+        ))
+    except HTTPException as e:
+        await manager.send_json({"status": "error", "detail": e.detail}, websocket)
+        return FrameEncoder()
+
+
+async def apply_encoding_message(websocket: WebSocket, text: str, encoder: FrameEncoder):
+    """
+    处理客户端发送的编码配置消息，例如 {"type": "encoding", "format": "webp", "quality": 70, "scale": 0.5}。
+
+    @param websocket: 客户端的WebSocket连接对象。
+    @param text: 文本消息内容。
+    @param encoder: 当前使用的编码器。
+    @return: 新的编码器；配置无效时返回原编码器。
+    """
+    try:
+        config = json.loads(text)
+        encoder = FrameEncoder(parse_encode_options(
+            config.get("format"), config.get("quality"), config.get("scale")
+        ))
+        await manager.send_json({"status": "encoding", "encoding": encoder.options.to_dict()}, websocket)
+    except (ValueError, AttributeError, HTTPException) as e:
+        await manager.send_json({"status": "error", "detail": getattr(e, "detail", str(e))}, websocket)
+    return encoder
+
+
+def process_camera_frame(frame, stream: str, encoder: FrameEncoder):
+    """
+    对实时摄像头的一帧进行检测、报警判定和统计，并按协商的参数编码标记后的图像。
+
+    @param frame: BGR格式的图像帧。
+    @param stream: 数据流ID。
+    @param encoder: 帧编码器。
+    @return: 发送给客户端的响应字典。
+    """
+    global total_image_detections, today_image_detections, total_image_alerts, today_image_alerts
+    # 使用模型进行预测
+    results = model(frame)
+
+    detections = []
+    # 遍历检测结果
+    for result in results:
+        for box in result.boxes:
+            # 提取边界框坐标和置信度
+            x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+            conf = float(box.conf[0])
+            cls = int(box.cls[0])
+            label = result.names[cls]
+
+            # 添加检测到的对象信息到列表中
+            detections.append({
+                "bbox": [x1, y1, x2, y2],
+                "confidence": conf,
+                "fish_en": label,
+                "fish_cn": fish_labels.get(label, label)
+            })
+
+    # 由报警引擎按阈值规则标记低置信度目标并计数
+    alert_count = alert_engine.observe(stream, detections)
+
+    # 更新总图像检测次数
+    total_image_detections += len(detections)
+    if datetime.now().date() == current_date:
+        # 更新当天图像检测次数
+        today_image_detections += len(detections)
+
+    # 更新总图像警告次数
+    total_image_alerts += alert_count
+    if datetime.now().date() == current_date:
+        # 更新当天图像警告次数
+        today_image_alerts += alert_count
+
+    # 更新时间序列汇总
+    rollups.record("camera", detections, alert_count)
+
+    # 在图像上绘制边界框，并按协商的参数编码为Base64字符串（format为none时不返回图像）
+    frame_base64 = None
+    if encoder.options.format != "none":
+        frame_with_boxes = draw_boxes(frame, detections)
+        frame_base64 = encoder.encode_base64(frame_with_boxes)
+
+    return {
+        "status": "success",
+        "detections": detections,
+        "frame": frame_base64,
+        "frame_format": encoder.options.mime_type
+    }
+
+
 @app.websocket("/ws/fish-detection")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -285,82 +543,102 @@ async def websocket_endpoint(websocket: WebSocket):
     
     @param websocket: 客户端的WebSocket连接对象。
     """
-    global total_image_detections, today_image_detections, total_image_alerts, today_image_alerts
-    global total_video_detections, today_video_detections, total_video_alerts, today_video_alerts
     # 连接到WebSocket管理器
     await manager.connect(websocket)
+    # 客户端可通过 ?stream=名称 指定数据流，用于匹配报警规则
+    stream = new_stream_id("camera", websocket.query_params.get("stream"))
+    # 客户端可通过 ?format=webp&quality=70&scale=0.5 或发送文本配置消息协商返回图像的编码方式
+    encoder = await websocket_encoder(websocket)
     try:
         while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("text") is not None:
+                encoder = await apply_encoding_message(websocket, message["text"], encoder)
+                continue
             # 接收来自客户端的字节数据
-            data = await websocket.receive_bytes()
+            data = message["bytes"]
             # 将字节数据转换为NumPy数组
             nparr = np.frombuffer(data, np.uint8)
             # 解码图像帧
             frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-            # 使用模型进行预测
-            results = model(frame)
-
-            detections = []
-            alert_count = 0
-            threshold = 0.5
-            # 遍历检测结果
-            for result in results:
-                for box in result.boxes:
-                    # 提取边界框坐标和置信度
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                    conf = float(box.conf[0])
-                    cls = int(box.cls[0])
-                    label = result.names[cls]
-
-                    # 添加检测到的对象信息到列表中
-                    detections.append({
-                        "bbox": [x1, y1, x2, y2],
-                        "confidence": conf,
-                        "fish_en": label,
-                        "fish_cn": fish_labels.get(label, label)
-                    })
-
-                    # 如果置信度低于阈值，增加警告计数
-                    if conf < threshold:
-                        alert_count += 1
-
-            # 更新总图像检测次数
-            total_image_detections += len(detections)
-            if datetime.now().date() == current_date:
-                # 更新当天图像检测次数
-                today_image_detections += len(detections)
-
-            # 更新总图像警告次数
-            total_image_alerts += alert_count
-            if datetime.now().date() == current_date:
-                # 更新当天图像警告次数
-                today_image_alerts += alert_count
-
-            # 如果有警告，广播警告信息
-            if alert_count > 0:
-                await manager.broadcast_alert({"alert": f"识别度低于阈值的目标数: {alert_count}"})
-
-            # 在图像上绘制边界框
-            frame_with_boxes = draw_boxes(frame, detections, threshold)
-            # 编码图像为JPEG格式
-            _, buffer = cv2.imencode('.jpg', frame_with_boxes)
-            # 将图像转换为字节数组
-            frame_bytes = buffer.tobytes()
-            # 将字节数组编码为Base64字符串
-            frame_base64 = base64.b64encode(frame_bytes).decode('utf - 8')
-
             # 发送包含状态、检测信息和图像的JSON响应给客户端
-            await manager.send_json({
-                "status": "success",
-                "detections": detections,
-                "frame": frame_base64
-            }, websocket)
+            await manager.send_json(process_camera_frame(frame, stream, encoder), websocket)
 
     except WebSocketDisconnect:
         # 处理客户端断开连接的情况
-        manager.disconnect(websocket)
         print("Client disconnected")
+    finally:
+        # 连接因任何原因结束时都需移除连接并结束该数据流的报警事件
+        manager.disconnect(websocket)
+        alert_engine.close_stream(stream)
+
+
+@app.websocket("/ws/local-detection")
+async def local_detection_endpoint(websocket: WebSocket):
+    """
+    本机帧源的检测端点：从共享内存环形缓冲区零拷贝读取生产者写入的原始BGR帧，
+    始终处理最新一帧并推送检测结果，省去JPEG编解码和帧数据的网络传输。
+
+    连接参数: ?ring=共享内存名称，其余参数（stream、format、quality、scale）与 /ws/fish-detection 相同。
+    响应在 /ws/fish-detection 的基础上增加 seq（帧序号）、dropped（跳过的帧数）、
+    latency_ms（生产者写入到结果发送的耗时）、frame_timestamp（生产者写入该帧的Unix时间戳，
+    客户端可据此计算到收到结果为止的端到端延迟）和 overwritten（处理期间槽位是否被覆盖）。
+
+    @param websocket: 客户端的WebSocket连接对象。
+    """
+    await manager.connect(websocket)
+    ring_name = websocket.query_params.get("ring")
+    try:
+        ring = SharedFrameRing.attach(ring_name)
+    except (OSError, ValueError, TypeError) as e:
+        await manager.send_json({"status": "error", "detail": f"无法打开共享内存 {ring_name}: {e}"}, websocket)
+        manager.disconnect(websocket)
+        await websocket.close()
+        return
+
+    stream = new_stream_id("camera", websocket.query_params.get("stream") or f"local-{ring_name}")
+    encoder = await websocket_encoder(websocket)
+    # 在后台等待客户端消息，用于感知断开连接和编码配置
+    receiver = asyncio.ensure_future(websocket.receive())
+    last_seq = 0
+    try:
+        while True:
+            if receiver.done():
+                message = receiver.result()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("text") is not None:
+                    encoder = await apply_encoding_message(websocket, message["text"], encoder)
+                receiver = asyncio.ensure_future(websocket.receive())
+
+            ref, dropped = ring.read_latest(last_seq)
+            if ref is None:
+                await asyncio.sleep(LOCAL_POLL_INTERVAL)
+                continue
+
+            response = process_camera_frame(ref.frame, stream, encoder)
+            response.update({
+                "seq": ref.seq,
+                "dropped": dropped,
+                "latency_ms": (time.time() - ref.timestamp) * 1000,
+                "frame_timestamp": ref.timestamp,
+                # 处理期间生产者已覆盖该槽位时，检测结果可能对应不完整的帧
+                "overwritten": not ref.valid()
+            })
+            last_seq = ref.seq
+            await manager.send_json(response, websocket)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        manager.disconnect(websocket)
+        alert_engine.close_stream(stream)
+        # 模型可能仍保留最后一帧的视图，共享内存在该视图释放后才解除映射
+        ring.close()
+        print(f"Local stream {ring_name} disconnected")
 
 
 # Ollama API 调用函数
@@ -467,17 +745,124 @@ async def get_dashboard_info():
     }
 
 
+def parse_analytics_time(value: str, name: str):
+    """
+    解析数据分析接口的时间参数。
+
+    @param value: 时间字符串，格式为"YYYY-MM-DD HH:MM:SS"，可为空。
+    @param name: 参数名，用于错误提示。
+    @return: datetime对象或None。
+    @raises HTTPException: 时间格式错误时抛出400异常。
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise HTTPException(400, f"{name}格式错误，应为YYYY-MM-DD HH:MM:SS")
+
+
+def check_analytics_source(source: str):
+    """
+    校验数据来源参数。
+
+    @param source: image、video、camera 或 all。
+    @raises HTTPException: 来源无效时抛出400异常。
+    """
+    if source not in SOURCES + (ALL_SOURCES,):
+        raise HTTPException(400, f"source 应为 {', '.join(SOURCES + (ALL_SOURCES,))} 之一")
+
+
+@app.get("/analytics/summary")
+async def get_analytics_summary(source: str = Query(ALL_SOURCES)):
+    """
+    获取全量与当天的鱼种计数、报警数和置信度分布。
+
+    @param source: 数据来源，image、video、camera 或 all。
+    @return: 包含鱼种中文名映射及 total、today 汇总的字典。
+    """
+    check_analytics_source(source)
+    summary = rollups.summary(source)
+    summary["species_names"] = {name: fish_labels.get(name, name) for name in rollups.species}
+    return summary
+
+
+@app.get("/analytics/timeseries")
+async def get_analytics_timeseries(
+    granularity: str = Query("hour"),
+    source: str = Query(ALL_SOURCES),
+    start_time: str = Query(None),
+    end_time: str = Query(None),
+    limit: int = Query(60, ge=1, le=1440)
+):
+    """
+    获取按分钟/小时/天汇总的时间序列。
+
+    @param granularity: 汇总粒度，minute、hour 或 day。
+    @param source: 数据来源，image、video、camera 或 all。
+    @param start_time: 起始时间，格式为"YYYY-MM-DD HH:MM:SS"
+    @param end_time: 结束时间，格式为"YYYY-MM-DD HH:MM:SS"，默认为当前时间
+    @param limit: 最多返回的桶数量。
+    @return: 包含鱼种中文名映射与时间序列的字典。
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(400, f"granularity 应为 {', '.join(GRANULARITIES)} 之一")
+    check_analytics_source(source)
+    start = parse_analytics_time(start_time, "start_time")
+    end = parse_analytics_time(end_time, "end_time")
+    return {
+        "granularity": granularity,
+        "source": source,
+        "species_names": {name: fish_labels.get(name, name) for name in rollups.species},
+        "series": rollups.series(granularity, source, start, end, limit)
+    }
+
+
+@app.get("/alerts/rules")
+async def get_alert_rules():
+    """
+    获取当前的报警阈值规则。
+
+    @return: 阈值规则字典。
+    """
+    return alert_engine.rules
+
+
+@app.put("/alerts/rules")
+async def update_alert_rules(rules: dict):
+    """
+    更新报警阈值规则并保存到文件。
+
+    @param rules: 阈值规则，格式为 {"default": 0.5, "species": {...}, "streams": {"camera": {...}}}
+    @return: 更新后的阈值规则。
+    @raises HTTPException: 规则格式错误时抛出400异常。
+    """
+    try:
+        alert_engine.set_rules(rules)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    save_rules(ALERT_RULES_FILE, alert_engine.rules)
+    return alert_engine.rules
+
+
 @app.post("/upload/image")
 async def upload_image(
-        file: bytes = File(...)
+        file: bytes = File(...),
+        format: str = Query(None),
+        quality: int = Query(None),
+        scale: float = Query(None)
 ):
     """
     处理上传的图片，进行目标检测并返回检测结果和标记后的图片。
 
     @param file: 上传的图片文件，以字节流形式传入
+    @param format: 返回图片的格式，jpeg（默认）、webp 或 none（不返回图片）
+    @param quality: 返回图片的编码质量，1-100
+    @param scale: 返回图片的缩放比例，0.1-1.0
     @return: 包含检测结果和标记后图片的字典
     """
     global total_image_detections, today_image_detections, total_image_alerts, today_image_alerts
+    options = parse_encode_options(format, quality, scale)
     try:
         # 将字节流转换为NumPy数组
         nparr = np.frombuffer(file, np.uint8)
@@ -492,8 +877,6 @@ async def upload_image(
         results = model(image)
 
         detections = []
-        alert_count = 0
-        threshold = 0.5
         # 遍历检测结果
         for result in results:
             for box in result.boxes:
@@ -511,9 +894,8 @@ async def upload_image(
                     "fish_cn": fish_labels.get(label, label)
                 })
 
-                # 如果置信度低于阈值，增加警告计数
-                if conf < threshold:
-                    alert_count += 1
+        # 由报警引擎按阈值规则标记低置信度目标并计数，连续上传的同类问题合并为一次报警
+        alert_count = alert_engine.observe("image", detections)
 
         # 更新全局检测计数器
         total_image_detections += len(detections)
@@ -525,22 +907,21 @@ async def upload_image(
         if datetime.now().date() == current_date:
             today_image_alerts += alert_count
 
-        # 如果有警告，广播警告信息
-        if alert_count > 0:
-            await manager.broadcast_alert({"alert": f"识别度低于阈值的目标数: {alert_count}"})
+        # 更新时间序列汇总
+        rollups.record("image", detections, alert_count)
 
-        # 在图像上绘制边界框
-        image_with_boxes = draw_boxes(image, detections, threshold)
-        # 编码图像为JPEG格式
-        _, buffer = cv2.imencode('.jpg', image_with_boxes)
-        image_bytes = buffer.tobytes()
-        # 将图像转换为Base64编码字符串
-        image_base64 = base64.b64encode(image_bytes).decode('utf - 8')
+        # 在图像上绘制边界框，按原始分辨率编码用于保存
+        image_with_boxes = draw_boxes(image, detections)
+        image_bytes = FrameEncoder(STORAGE_OPTIONS).encode(image_with_boxes)
+        # 按客户端请求的参数编码返回的图片，参数与保存参数一致时直接复用
+        if options == STORAGE_OPTIONS:
+            image_base64 = base64.b64encode(image_bytes).decode('ascii')
+        else:
+            image_base64 = FrameEncoder(options).encode_base64(image_with_boxes)
 
-        # 保存标记好的图片到 images 目录
-        image_save_path = os.path.join(IMAGES_DIR, f"{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg")
-        with open(image_save_path, 'wb') as f:
-            f.write(image_bytes)
+        # 保存标记好的图片到 images 目录，并在后台生成缩略图
+        image_save_path = media_store.save_bytes("images", image_bytes, ".jpg")
+        media_store.schedule_derivatives(image_save_path)
 
         # 保存图片检测记录
         log_entry = {
@@ -548,7 +929,8 @@ async def upload_image(
             "timestamp": datetime.now().strftime("%Y - %m - %d %H:%M:%S"),
             "detections": detections,
             "alert_count": alert_count,
-            "marked_image_path": image_save_path
+            "marked_image_path": image_save_path,
+            "thumbnail_path": media_store.thumbnail_path(image_save_path)
         }
         save_log_entry(log_entry)
 
@@ -556,7 +938,8 @@ async def upload_image(
         return {
             "status": "success",
             "detections": detections,
-            "image": image_base64
+            "image": image_base64,
+            "image_format": options.mime_type
         }
 
     except Exception as e:
@@ -566,15 +949,22 @@ async def upload_image(
 
 @app.post("/upload/video")
 async def upload_video(
-        file: bytes = File(...)
+        file: bytes = File(...),
+        format: str = Query(None),
+        quality: int = Query(None),
+        scale: float = Query(None)
 ):
     """
     处理上传的视频文件，进行目标检测并记录检测结果。
 
     @param file: 上传的视频文件，类型为字节流。
+    @param format: 返回视频帧的格式，jpeg（默认）、webp 或 none（不返回视频帧）
+    @param quality: 返回视频帧的编码质量，1-100
+    @param scale: 返回视频帧的缩放比例，0.1-1.0
     @return: 包含处理结果的字典，包括状态、帧数、FPS、检测结果和视频帧数据。
     """
     global total_video_detections, today_video_detections, total_video_alerts, today_video_alerts
+    encoder = FrameEncoder(parse_encode_options(format, quality, scale))
     try:
         # 创建一个临时文件来保存上传的视频文件
         with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_file:
@@ -591,7 +981,12 @@ async def upload_video(
         frame_count = 0
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_alert_count = 0
-        threshold = 0.5
+        # 每个视频作为独立的数据流，整段视频中的同类问题合并为一次报警
+        stream = new_stream_id("video")
+
+        # 标记后的帧直接流式写入视频文件，帧率按抽帧间隔折算以保持原视频时长
+        video_temp_path = media_store.temp_path("videos", ".mp4")
+        writer = StreamingVideoWriter(video_temp_path, fps / VIDEO_SAMPLE_INTERVAL)
 
         video_frames = []
         # 逐帧读取视频文件
@@ -600,12 +995,11 @@ async def upload_video(
             if not success:
                 break
 
-            # 每5帧进行一次目标检测
-            if frame_count % 5 == 0:
+            # 每隔VIDEO_SAMPLE_INTERVAL帧进行一次目标检测
+            if frame_count % VIDEO_SAMPLE_INTERVAL == 0:
                 results = model(frame)
 
                 frame_detections = []
-                frame_alert_count = 0
                 # 遍历检测结果
                 for result in results:
                     for box in result.boxes:
@@ -624,9 +1018,8 @@ async def upload_video(
                             "fish_cn": fish_labels.get(label, label)
                         })
 
-                        # 如果置信度低于阈值，增加警告计数
-                        if conf < threshold:
-                            frame_alert_count += 1
+                # 由报警引擎按阈值规则标记低置信度目标并计数
+                frame_alert_count = alert_engine.observe(stream, frame_detections)
 
                 # 更新全局和当天的检测计数
                 detections.extend(frame_detections)
@@ -640,37 +1033,33 @@ async def upload_video(
                 if datetime.now().date() == current_date:
                     today_video_alerts += frame_alert_count
 
-                # 如果有警告，广播警告信息
-                if frame_alert_count > 0:
-                    await manager.broadcast_alert({"alert": f"当前帧识别度低于阈值的目标数: {frame_alert_count}"})
+                # 更新时间序列汇总
+                rollups.record("video", frame_detections, frame_alert_count)
 
-                # 在帧上绘制检测框并编码为base64格式
-                frame_with_boxes = draw_boxes(frame, frame_detections, threshold)
-                _, buffer = cv2.imencode('.jpg', frame_with_boxes)
-                frame_bytes = buffer.tobytes()
-                frame_base64 = base64.b64encode(frame_bytes).decode('utf - 8')
-                video_frames.append(frame_base64)
+                # 在帧上绘制检测框，写入视频文件，并按请求的参数编码为base64格式返回
+                frame_with_boxes = draw_boxes(frame, frame_detections)
+                writer.write(frame_with_boxes)
+                frame_base64 = encoder.encode_base64(frame_with_boxes)
+                if frame_base64 is not None:
+                    video_frames.append(frame_base64)
 
             frame_count += 1
 
-        # 如果有警告，广播警告信息
-        if total_alert_count > 0:
-            await manager.broadcast_alert({"alert": f"视频中识别度低于阈值的总目标数: {total_alert_count}"})
+        # 视频处理完成，结束该数据流的报警事件
+        alert_engine.close_stream(stream)
 
         # 释放视频资源并删除临时文件
         cap.release()
         os.unlink(temp_path)
 
-        # 保存标记好的视频为文件到videos目录
-        video_save_path = os.path.join(VIDEOS_DIR, f"{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4")
-        if video_frames:
-            height, width, _ = cv2.imdecode(np.frombuffer(base64.b64decode(video_frames[0]), np.uint8), cv2.IMREAD_COLOR).shape
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(video_save_path, fourcc, fps, (width, height))
-            for frame_base64 in video_frames:
-                frame = cv2.imdecode(np.frombuffer(base64.b64decode(frame_base64), np.uint8), cv2.IMREAD_COLOR)
-                out.write(frame)
-            out.release()
+        # 归档标记好的视频文件到videos目录，并在后台生成缩略图和预览片段
+        writer.close()
+        video_save_path = None
+        if writer.frames:
+            video_save_path = media_store.commit_file(video_temp_path, ".mp4")
+            media_store.schedule_derivatives(video_save_path)
+        elif os.path.exists(video_temp_path):
+            os.unlink(video_temp_path)
 
         # 保存视频检测记录
         log_entry = {
@@ -680,7 +1069,9 @@ async def upload_video(
             "total_alert_count": total_alert_count,
             "total_frames": frame_count,
             "fps": fps,
-            "marked_video_path": video_save_path if video_frames else None
+            "marked_video_path": video_save_path,
+            "thumbnail_path": media_store.thumbnail_path(video_save_path) if video_save_path else None,
+            "preview_path": media_store.preview_path(video_save_path) if video_save_path else None
         }
         save_log_entry(log_entry)
 
@@ -690,16 +1081,52 @@ async def upload_video(
             "total_frames": frame_count,
             "fps": fps,
             "detections": detections,
-            "video_frames": video_frames
+            "video_frames": video_frames,
+            "frame_format": encoder.options.mime_type
         }
 
     except Exception as e:
         # 如果发生异常，删除临时文件并抛出HTTP异常
         if "temp_path" in locals() and os.path.exists(temp_path):
             os.unlink(temp_path)
+        if "writer" in locals():
+            writer.close()
+            if os.path.exists(video_temp_path):
+                os.unlink(video_temp_path)
+        if "stream" in locals():
+            alert_engine.close_stream(stream)
         raise HTTPException(500, f"处理视频时发生错误: {str(e)}")
 
 app.mount("/history_logs", StaticFiles(directory="history_logs"), name="history_logs")
+
+
+def media_url(path: str):
+    """
+    根据媒体文件路径生成访问URL。
+
+    @param path: 以history_logs开头的文件路径，兼容Windows分隔符。
+    @return: 可直接在浏览器访问的URL。
+    """
+    return f"http://127.0.0.1:8000/{normalize_path(path)}"
+
+
+def derivative_url(media_path: str, derive):
+    """
+    生成缩略图或预览片段的URL。衍生文件尚未生成时（例如旧记录）提交后台生成任务并返回None，
+    前端此时回退显示原文件。
+
+    @param media_path: 原媒体文件路径。
+    @param derive: 由原文件路径计算衍生文件路径的函数。
+    @return: 衍生文件URL或None。
+    """
+    path = derive(media_path)
+    if os.path.exists(path):
+        return media_url(path)
+    if os.path.exists(normalize_path(media_path)):
+        media_store.schedule_derivatives(media_path)
+    return None
+
+
 @app.get("/history")
 async def get_history(
     start_time: str = Query(None),
@@ -759,23 +1186,20 @@ async def get_history(
 
     # 处理过滤后的日志，生成对应的URL
     for log in filtered_logs:
-        if log["type"] == "image" and "marked_image_path" in log:
-            # 为图片类型的日志生成图片URL
-            log["image_url"] = f"http://127.0.0.1:8000/{log['marked_image_path'].replace('\\', '/')}"
-        elif log["type"] == "video" and "marked_video_path" in log:
-            # 去除重复的 history_logs 前缀
-            path = log["marked_video_path"]
-            if path.startswith("history_logs/"):
-                path = path[len("history_logs/"):]
-            # 确保路径使用正斜杠
-            path = path.replace('\\', '/')
-            # 为视频类型的日志生成视频URL
-            log["video_url"] = f"http://127.0.0.1:8000/{path}"
-            print(f"返回给前端的视频路径: {log['video_url']}")
+        if log["type"] == "image" and log.get("marked_image_path"):
+            # 为图片类型的日志生成原图与缩略图URL
+            log["image_url"] = media_url(log["marked_image_path"])
+            log["thumbnail_url"] = derivative_url(log["marked_image_path"], media_store.thumbnail_path)
+        elif log["type"] == "video" and log.get("marked_video_path"):
+            # 为视频类型的日志生成视频、封面与预览片段URL
+            log["video_url"] = media_url(log["marked_video_path"])
+            log["thumbnail_url"] = derivative_url(log["marked_video_path"], media_store.thumbnail_path)
+            log["preview_url"] = derivative_url(log["marked_video_path"], media_store.preview_path)
         else:
-            # 对于其他类型的日志，设置URL为None
+            # 对于其他类型的日志或媒体文件已被清理的日志，设置URL为None
             log["image_url"] = None
             log["video_url"] = None
+            log["thumbnail_url"] = None
 
     # 返回过滤后的日志列表
     return filtered_logs
@@ -0,0 +1,380 @@
+"""
+历史检测媒体文件存储管理
+
+负责标记后图片/视频的保存、缩略图与预览片段的后台生成，以及按容量和时间的清理。
+
+目录结构（以 history_logs 为根目录）:
+    images/YYYY/MM/DD/<内容哈希>.jpg      标记后的图片
+    videos/YYYY/MM/DD/<内容哈希>.mp4      标记后的视频
+    thumbs/<与原文件相同的相对路径>.jpg   图片/视频缩略图
+    previews/videos/.../<内容哈希>.mp4    视频预览片段
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+
+from encoding import StreamingVideoWriter
+
+# 缩略图最长边（像素）
+THUMBNAIL_SIZE = 320
+# 缩略图JPEG质量
+THUMBNAIL_QUALITY = 75
+# 预览片段时长（秒）、宽度（像素）与帧率
+PREVIEW_SECONDS = 4
+PREVIEW_WIDTH = 320
+PREVIEW_FPS = 10
+# 默认保留策略：总容量上限与最长保留天数
+MAX_STORAGE_BYTES = 5 * 1024 ** 3
+MAX_AGE_DAYS = 90
+# 未完成写入的临时文件超过该时长（秒）视为残留
+STALE_TEMP_SECONDS = 24 * 3600
+# 内容哈希在文件名中保留的长度
+HASH_LENGTH = 20
+
+MEDIA_KINDS = ("images", "videos")
+# 临时文件名中的标记，扩展名保留在最后以便VideoWriter识别容器格式
+TEMP_MARKER = ".part"
+
+
+def normalize_path(path):
+    """
+    统一路径分隔符为正斜杠，兼容旧日志中的Windows路径。
+
+    @param path: 原始路径。
+    @return: 使用正斜杠的路径；输入为空时原样返回。
+    """
+    return path.replace("\\", "/") if path else path
+
+
+def drop_media_references(logs, removed_paths):
+    """
+    将日志中指向已删除媒体文件的引用置空，保留检测记录本身以便统计。
+
+    @param logs: 日志条目列表，原地修改。
+    @param removed_paths: 被删除的媒体文件路径集合（使用正斜杠）。
+    @return: 是否有日志条目被修改。
+    """
+    changed = False
+    for log in logs:
+        for key in ("marked_image_path", "marked_video_path"):
+            if normalize_path(log.get(key)) in removed_paths:
+                # 媒体文件已被清理，去掉原文件与衍生文件的引用
+                log[key] = None
+                log.pop("thumbnail_path", None)
+                log.pop("preview_path", None)
+                changed = True
+    return changed
+
+
+def _temp_name(path, suffix):
+    return f"{path}.{uuid.uuid4().hex}{TEMP_MARKER}{suffix}"
+
+
+def _is_temp(path):
+    return f"{TEMP_MARKER}." in os.path.basename(path)
+
+
+class MediaStore:
+    def __init__(self, root, max_bytes=MAX_STORAGE_BYTES, max_age_days=MAX_AGE_DAYS):
+        """
+        初始化媒体存储。
+
+        @param root: 存储根目录，即 history_logs。
+        @param max_bytes: 媒体及衍生文件的总容量上限（字节），为None时不限制。
+        @param max_age_days: 媒体文件最长保留天数，为None时不限制。
+        """
+        self.root = normalize_path(root).rstrip("/")
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        # 缩略图与预览片段在单独的后台线程中生成，避免阻塞请求处理
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media-store")
+        self._pending = set()
+        self._lock = threading.Lock()
+        for kind in MEDIA_KINDS:
+            os.makedirs(f"{self.root}/{kind}", exist_ok=True)
+
+    # ========================
+    # 保存
+    # ========================
+
+    def _shard_dir(self, kind, when=None):
+        """按日期分片的目录，例如 history_logs/images/2025/04/15。"""
+        when = when or datetime.now()
+        directory = f"{self.root}/{kind}/{when:%Y/%m/%d}"
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def temp_path(self, kind, suffix):
+        """
+        生成一个唯一的临时文件路径，用于边处理边写入的文件（例如视频）。
+        写入完成后需调用 commit_file 归档。
+
+        @param kind: 媒体类型，images 或 videos。
+        @param suffix: 文件扩展名，例如 ".mp4"。
+        @return: 临时文件路径。
+        """
+        return f"{self._shard_dir(kind)}/{uuid.uuid4().hex}{TEMP_MARKER}{suffix}"
+
+    def save_bytes(self, kind, data, suffix):
+        """
+        以内容哈希命名保存文件，同一秒内的多次上传不会互相覆盖，相同内容只存一份。
+
+        @param kind: 媒体类型，images 或 videos。
+        @param data: 文件内容。
+        @param suffix: 文件扩展名，例如 ".jpg"。
+        @return: 保存后的文件路径。
+        """
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        path = f"{self._shard_dir(kind)}/{digest}{suffix}"
+        if not os.path.exists(path):
+            # 先写临时文件再原子替换，避免读取到写了一半的文件
+            temp = _temp_name(path, suffix)
+            with open(temp, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)
+        return path
+
+    def commit_file(self, temp_path, suffix):
+        """
+        将写入完成的临时文件按内容哈希重命名归档。
+
+        @param temp_path: temp_path 返回的临时文件路径。
+        @param suffix: 文件扩展名。
+        @return: 归档后的文件路径。
+        """
+        sha = hashlib.sha256()
+        with open(temp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        path = f"{os.path.dirname(temp_path)}/{sha.hexdigest()[:HASH_LENGTH]}{suffix}"
+        if os.path.exists(path):
+            os.unlink(temp_path)
+        else:
+            os.replace(temp_path, path)
+        return path
+
+    # ========================
+    # 缩略图与预览
+    # ========================
+
+    def _derived_path(self, category, media_path, suffix):
+        relative = os.path.relpath(normalize_path(media_path), self.root).replace("\\", "/")
+        base, _ = os.path.splitext(relative)
+        return f"{self.root}/{category}/{base}{suffix}"
+
+    def thumbnail_path(self, media_path):
+        """
+        @param media_path: 图片或视频路径。
+        @return: 对应缩略图的路径（文件可能尚未生成）。
+        """
+        return self._derived_path("thumbs", media_path, ".jpg")
+
+    def preview_path(self, video_path):
+        """
+        @param video_path: 视频路径。
+        @return: 对应预览片段的路径（文件可能尚未生成）。
+        """
+        return self._derived_path("previews", video_path, ".mp4")
+
+    def schedule_derivatives(self, media_path):
+        """
+        提交后台任务生成缩略图（视频另生成预览片段），已存在或已在队列中的文件不会重复生成。
+
+        @param media_path: 图片或视频路径。
+        """
+        media_path = normalize_path(media_path)
+        with self._lock:
+            if media_path in self._pending:
+                return
+            self._pending.add(media_path)
+        self.executor.submit(self._build_derivatives, media_path)
+
+    def _build_derivatives(self, media_path):
+        try:
+            if not os.path.exists(media_path):
+                return
+            is_video = media_path.startswith(f"{self.root}/videos/")
+            thumb = self.thumbnail_path(media_path)
+            if not os.path.exists(thumb):
+                self._write_thumbnail(media_path, thumb, is_video)
+            if is_video:
+                preview = self.preview_path(media_path)
+                if not os.path.exists(preview):
+                    self._write_preview(media_path, preview)
+        except Exception as e:
+            print(f"生成缩略图/预览失败 {media_path}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(media_path)
+
+    @staticmethod
+    def _fit(width, height, limit):
+        scale = min(1.0, limit / max(width, height))
+        # 宽高取偶数，满足视频编码器的要求
+        return max(2, int(width * scale) & ~1), max(2, int(height * scale) & ~1)
+
+    def _write_thumbnail(self, media_path, thumb_path, is_video):
+        if is_video:
+            cap = cv2.VideoCapture(media_path)
+            success, frame = cap.read()
+            cap.release()
+            if not success:
+                return
+        else:
+            frame = cv2.imread(media_path, cv2.IMREAD_COLOR)
+            if frame is None:
+                return
+        height, width = frame.shape[:2]
+        thumb = cv2.resize(frame, self._fit(width, height, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+        success, buffer = cv2.imencode(".jpg", thumb, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+        if success:
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            temp = _temp_name(thumb_path, ".jpg")
+            with open(temp, "wb") as f:
+                f.write(buffer.tobytes())
+            os.replace(temp, thumb_path)
+
+    def _write_preview(self, video_path, preview_path):
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return
+        fps = cap.get(cv2.CAP_PROP_FPS) or PREVIEW_FPS
+        # 按目标帧率抽帧，只保留开头若干秒
+        step = max(1, round(fps / PREVIEW_FPS))
+        max_frames = int(fps * PREVIEW_SECONDS)
+        os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+        temp = _temp_name(preview_path, ".mp4")
+        out = StreamingVideoWriter(temp, fps / step)
+        size = None
+        index = 0
+        try:
+            while index < max_frames:
+                success, frame = cap.read()
+                if not success:
+                    break
+                if index % step == 0:
+                    if size is None:
+                        height, width = frame.shape[:2]
+                        size = self._fit(width, height, PREVIEW_WIDTH)
+                    out.write(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+                index += 1
+        finally:
+            cap.release()
+            out.close()
+        if out.frames:
+            os.replace(temp, preview_path)
+
+    # ========================
+    # 清理与压缩
+    # ========================
+
+    def _scan(self, category):
+        """遍历某个子目录下的全部文件，返回 (路径, 大小, 修改时间) 列表。"""
+        entries = []
+        for directory, _, files in os.walk(f"{self.root}/{category}"):
+            for name in files:
+                path = f"{normalize_path(directory)}/{name}"
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _remove_media(self, path):
+        self._remove(path)
+        self._remove(self.thumbnail_path(path))
+        if path.startswith(f"{self.root}/videos/"):
+            self._remove(self.preview_path(path))
+
+    def _remove_empty_dirs(self, category):
+        # 请求线程会随时在当天（跨零点时为前一天）的分片目录中创建文件，这些目录及其上级目录不删除
+        base = f"{self.root}/{category}"
+        keep = {base}
+        now = datetime.now()
+        for when in (now, now - timedelta(days=1)):
+            keep.update((f"{base}/{when:%Y}", f"{base}/{when:%Y/%m}", f"{base}/{when:%Y/%m/%d}"))
+        for directory, _, _ in sorted(os.walk(base), reverse=True):
+            if normalize_path(directory) not in keep:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+    def enforce_retention(self, now=None):
+        """
+        执行一次清理：删除超期媒体，按从旧到新删除直到总容量低于上限，
+        再清除失去原文件的缩略图/预览、残留临时文件和空的日期目录。
+
+        该方法只操作文件系统，日志中的引用由调用方根据返回值更新。
+        应通过 schedule_retention 在后台线程中执行，以免与缩略图生成并发。
+
+        @param now: 当前时间戳，默认为 time.time()。
+        @return: 被删除的媒体文件路径集合。
+        """
+        now = now or time.time()
+        removed = set()
+
+        media = []
+        for kind in MEDIA_KINDS:
+            for path, size, mtime in self._scan(kind):
+                if _is_temp(path):
+                    # 正在写入的临时文件只在超时后清理
+                    if now - mtime > STALE_TEMP_SECONDS:
+                        self._remove(path)
+                    continue
+                media.append((path, size, mtime))
+        media.sort(key=lambda entry: entry[2])
+
+        # 按时间清理
+        if self.max_age_days is not None:
+            cutoff = now - self.max_age_days * 86400
+            while media and media[0][2] < cutoff:
+                path = media.pop(0)[0]
+                self._remove_media(path)
+                removed.add(path)
+
+        # 清除孤立的衍生文件，并按原文件汇总剩余衍生文件的大小
+        alive = {os.path.splitext(path)[0] for path, _, _ in media}
+        derived_sizes = {}
+        for category in ("thumbs", "previews"):
+            prefix = f"{self.root}/{category}/"
+            for path, size, _ in self._scan(category):
+                source = f"{self.root}/{os.path.splitext(path[len(prefix):])[0]}"
+                if _is_temp(path) or source not in alive:
+                    self._remove(path)
+                    continue
+                derived_sizes[source] = derived_sizes.get(source, 0) + size
+
+        # 按容量清理，媒体文件与其衍生文件一起计入
+        if self.max_bytes is not None:
+            total = sum(size + derived_sizes.get(os.path.splitext(path)[0], 0) for path, size, _ in media)
+            while media and total > self.max_bytes:
+                path, size, _ = media.pop(0)
+                total -= size + derived_sizes.get(os.path.splitext(path)[0], 0)
+                self._remove_media(path)
+                removed.add(path)
+
+        for category in MEDIA_KINDS + ("thumbs", "previews"):
+            self._remove_empty_dirs(category)
+        return removed
+
+    def schedule_retention(self):
+        """
+        在后台线程中执行一次清理。
+
+        @return: concurrent.futures.Future，结果为被删除的媒体文件路径集合。
+        """
+        return self.executor.submit(self.enforce_retention)
@@ -0,0 +1,115 @@
+"""
+共享内存帧生产者示例
+
+读取本地视频文件（或摄像头），将原始BGR帧按指定帧率写入共享内存环形缓冲区，
+供检测服务的 /ws/local-detection 接口零拷贝读取。每秒打印一次写入帧率和CPU占用，
+便于与浏览器经 WebSocket 推送JPEG的方式对比。每帧解码完成写入槽位时记录时间戳，
+压测脚本以此作为延迟起点，与 WebSocket 模式在客户端解码完成后开始计时的口径一致。
+
+用法示例:
+    python shm_producer.py history_logs/videos/20250415110128.mp4 --name fish-cam-1 --loop
+    然后连接 ws://127.0.0.1:8000/ws/local-detection?ring=fish-cam-1
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from shm_ring import SharedFrameRing, DEFAULT_SLOTS, MIN_SLOTS
+
+
+def open_source(source):
+    """
+    打开视频源，纯数字视为摄像头编号。
+
+    @param source: 视频文件路径或摄像头编号。
+    @return: cv2.VideoCapture对象。
+    """
+    cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not cap.isOpened():
+        raise SystemExit(f"无法打开视频源: {source}")
+    return cap
+
+
+def produce(args):
+    cap = open_source(args.source)
+    success, first = cap.read()
+    if not success:
+        raise SystemExit("视频源没有可读取的帧")
+    height, width = first.shape[:2]
+    fps = args.fps or cap.get(cv2.CAP_PROP_FPS) or 25
+    interval = 1.0 / fps
+
+    ring = SharedFrameRing.create(args.name, width, height, slots=args.slots)
+    print(f"已创建共享内存 {args.name}: {width}x{height}，{args.slots} 个槽位，目标帧率 {fps:.1f}")
+    print(f"检测服务地址: ws://127.0.0.1:8000/ws/local-detection?ring={args.name}")
+
+    ring.write(first)
+    written = 1
+    window_frames = 0
+    window_start = time.perf_counter()
+    cpu_start = time.process_time()
+    next_frame = time.perf_counter() + interval
+    try:
+        while True:
+            # 直接解码到共享内存槽位中，生产者端也不产生额外拷贝
+            seq, view = ring.begin_write()
+            success, frame = cap.read(view)
+            if not success:
+                if not args.loop:
+                    break
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            if not np.shares_memory(frame, view):
+                # 解码结果未能写入目标视图（例如尺寸变化）时退回拷贝
+                np.copyto(view, cv2.resize(frame, (width, height)) if frame.shape != view.shape else frame)
+            ring.commit(seq)
+            written += 1
+            window_frames += 1
+
+            now = time.perf_counter()
+            if now - window_start >= 1.0:
+                cpu = (time.process_time() - cpu_start) / (now - window_start) * 100
+                print(f"序号 {seq}，写入 {window_frames / (now - window_start):.1f} fps，CPU {cpu:.1f}%")
+                window_frames = 0
+                window_start = now
+                cpu_start = time.process_time()
+
+            # 按目标帧率节流
+            time.sleep(max(0.0, next_frame - now))
+            next_frame = max(next_frame + interval, time.perf_counter())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cap.release()
+        ring.close()
+    print(f"共写入 {written} 帧")
+
+
+def slot_count(value):
+    """
+    argparse 类型函数：解析槽位数并校验下限。
+
+    @param value: 命令行参数字符串。
+    @return: 槽位数。
+    @raises argparse.ArgumentTypeError: 槽位数小于下限时抛出。
+    """
+    slots = int(value)
+    if slots < MIN_SLOTS:
+        raise argparse.ArgumentTypeError(f"槽位数至少为{MIN_SLOTS}")
+    return slots
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="共享内存帧生产者示例")
+    parser.add_argument("source", help="视频文件路径或摄像头编号")
+    parser.add_argument("--name", default="fish-cam-1", help="共享内存名称")
+    parser.add_argument("--fps", type=float, help="写入帧率，默认使用视频自身帧率")
+    parser.add_argument("--slots", type=slot_count, default=DEFAULT_SLOTS, help="环形缓冲区槽位数")
+    parser.add_argument("--loop", action="store_true", help="视频结束后从头循环")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    produce(parse_args())
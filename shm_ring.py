@@ -0,0 +1,294 @@
+"""
+基于共享内存的帧环形缓冲区
+
+用于同一主机上的摄像头/视频源向检测服务传递原始BGR帧，省去浏览器JPEG编码、
+WebSocket传输和服务端解码的过程。生产者进程写入，检测服务以零拷贝的NumPy视图读取。
+
+内存布局:
+    文件头（64字节）: 魔数、版本、槽位数、宽、高、通道数、槽位步长、最新已提交序号
+    槽位 × N: 槽位头（64字节：开始序号、结束序号、时间戳）+ 帧数据
+
+写入采用顺序锁协议：先写开始序号，再写帧数据和时间戳，最后写结束序号并更新最新序号。
+缓冲区写满后覆盖最旧的槽位；读取方通过序号判断丢帧数，并可在使用完视图后调用
+FrameRef.valid() 确认该槽位在此期间没有被覆盖。
+
+帧视图由 np.frombuffer 创建，持有共享内存映射的缓冲区导出，close() 后映射要等到
+最后一个视图（包括被推理框架等调用方保留的视图）释放后才解除，不会留下悬空指针。
+"""
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = b"FRNG"
+VERSION = 1
+HEADER_FORMAT = "<4sIIIIIQQ"
+HEADER_SIZE = 64
+SLOT_HEADER_FORMAT = "<QQd"
+SLOT_HEADER_SIZE = 64
+# 帧数据按64字节对齐，便于向量化拷贝
+ALIGNMENT = 64
+DEFAULT_SLOTS = 8
+# 至少两个槽位：读取方使用一个槽位时，生产者写入另一个
+MIN_SLOTS = 2
+# 最新序号在文件头中的偏移
+WRITE_SEQ_OFFSET = struct.calcsize("<4sIIIIIQ")
+
+
+def _align(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _open_shared_memory(name):
+    """
+    以只附加（不负责释放）的方式打开已有的共享内存。
+
+    Python 3.13 之前附加方也会被 resource_tracker 登记，进程退出时会误删生产者的共享内存，
+    因此需要手动取消登记。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def _check_layout(shm):
+    """
+    校验共享内存的文件头与大小。
+
+    @param shm: SharedMemory对象。
+    @return: 解析后的文件头字段。
+    @raises ValueError: 大小不足、魔数或版本不符、尺寸无效时抛出。
+    """
+    if shm.size < HEADER_SIZE:
+        raise ValueError(f"共享内存 {shm.name} 小于文件头大小")
+    header = struct.unpack_from(HEADER_FORMAT, shm.buf, 0)
+    magic, version, slots, width, height, channels, stride, _ = header
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"共享内存 {shm.name} 不是有效的帧环形缓冲区")
+    if slots < MIN_SLOTS or not width or not height or not channels \
+            or stride < SLOT_HEADER_SIZE + width * height * channels:
+        raise ValueError(f"共享内存 {shm.name} 的文件头无效")
+    if shm.size < HEADER_SIZE + stride * slots:
+        raise ValueError(f"共享内存 {shm.name} 小于文件头声明的大小")
+    return header
+
+
+class FrameRef:
+    """环形缓冲区中一帧的零拷贝引用。"""
+
+    def __init__(self, ring, seq, timestamp, frame):
+        """
+        @param ring: 所属的SharedFrameRing。
+        @param seq: 帧序号（从1开始递增）。
+        @param timestamp: 生产者写入时的时间戳（time.time()）。
+        @param frame: 指向共享内存的NumPy视图，形状为 (高, 宽, 通道)。
+        """
+        self.ring = ring
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+
+    def valid(self):
+        """
+        @return: 该帧所在的槽位是否仍未被生产者覆盖。
+        """
+        begin, end, _ = self.ring._slot_header(self.seq)
+        return begin == self.seq and end == self.seq
+
+
+class SharedFrameRing:
+    def __init__(self, shm, owner):
+        """
+        请使用 create 或 attach 构造。
+
+        @param shm: SharedMemory对象。
+        @param owner: 是否为创建方（负责释放共享内存）。
+        @raises ValueError: 共享内存不是有效的帧环形缓冲区时抛出，此时已关闭 shm。
+        """
+        try:
+            magic, version, slots, width, height, channels, stride, _ = _check_layout(shm)
+        except ValueError:
+            shm.close()
+            raise
+        self.shm = shm
+        self.owner = owner
+        self.slots = slots
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.stride = stride
+        self.frame_size = width * height * channels
+        # 覆盖整段共享内存的数组；与 np.ndarray(buffer=...) 不同，它持有缓冲区导出，
+        # 由它派生的视图存在时映射无法被关闭
+        self._data = np.frombuffer(shm.buf, dtype=np.uint8)
+        # 预先为每个槽位建立NumPy视图，读写时不再创建新对象
+        self._views = []
+        for i in range(slots):
+            offset = self._slot_offset(i) + SLOT_HEADER_SIZE
+            self._views.append(self._data[offset:offset + self.frame_size].reshape(height, width, channels))
+        self.closed = False
+        self._next_seq = self.latest_seq() + 1
+
+    @classmethod
+    def create(cls, name, width, height, channels=3, slots=DEFAULT_SLOTS):
+        """
+        创建环形缓冲区（生产者调用）。
+
+        @param name: 共享内存名称。
+        @param width: 帧宽度。
+        @param height: 帧高度。
+        @param channels: 通道数，BGR为3。
+        @param slots: 槽位数（至少2个），越多越不容易在读取过程中被覆盖。
+        @return: SharedFrameRing对象。
+        @raises ValueError: 尺寸或槽位数无效时抛出。
+        """
+        if slots < MIN_SLOTS:
+            raise ValueError(f"槽位数至少为{MIN_SLOTS}")
+        if width <= 0 or height <= 0 or channels <= 0:
+            raise ValueError("帧尺寸无效")
+        stride = SLOT_HEADER_SIZE + _align(width * height * channels)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + stride * slots)
+        struct.pack_into(HEADER_FORMAT, shm.buf, 0, MAGIC, VERSION, slots, width, height, channels, stride, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        附加到已有的环形缓冲区（检测服务调用）。
+
+        @param name: 共享内存名称。
+        @return: SharedFrameRing对象。
+        @raises FileNotFoundError: 共享内存不存在时抛出。
+        @raises ValueError: 共享内存不是有效的帧环形缓冲区时抛出。
+        """
+        return cls(_open_shared_memory(name), owner=False)
+
+    def _slot_offset(self, index):
+        return HEADER_SIZE + index * self.stride
+
+    def _slot_header(self, seq):
+        return struct.unpack_from(SLOT_HEADER_FORMAT, self.shm.buf, self._slot_offset(seq % self.slots))
+
+    def latest_seq(self):
+        """
+        @return: 最新已提交的帧序号，0表示尚未写入任何帧。
+        """
+        return struct.unpack_from("<Q", self.shm.buf, WRITE_SEQ_OFFSET)[0]
+
+    # ========================
+    # 写入（生产者）
+    # ========================
+
+    def begin_write(self):
+        """
+        开始写入下一帧，返回目标槽位的视图，调用方可直接将帧解码到该视图中，写完后调用 commit。
+
+        @return: (序号, 槽位视图)
+        """
+        seq = self._next_seq
+        offset = self._slot_offset(seq % self.slots)
+        # 先写开始序号，读取方据此判断槽位正在被覆盖
+        struct.pack_into("<Q", self.shm.buf, offset, seq)
+        return seq, self._views[seq % self.slots]
+
+    def commit(self, seq, timestamp=None):
+        """
+        提交写入的帧，使其对读取方可见。
+
+        @param seq: begin_write 返回的序号。
+        @param timestamp: 帧时间戳，默认为当前时间。
+        """
+        offset = self._slot_offset(seq % self.slots)
+        struct.pack_into("<Qd", self.shm.buf, offset + 8, seq, timestamp if timestamp is not None else time.time())
+        struct.pack_into("<Q", self.shm.buf, WRITE_SEQ_OFFSET, seq)
+        self._next_seq = seq + 1
+
+    def write(self, frame, timestamp=None):
+        """
+        拷贝一帧到缓冲区并提交。
+
+        @param frame: BGR格式的图像帧，尺寸需与缓冲区一致。
+        @param timestamp: 帧时间戳，默认为当前时间。
+        @return: 帧序号。
+        """
+        seq, view = self.begin_write()
+        np.copyto(view, frame)
+        self.commit(seq, timestamp)
+        return seq
+
+    # ========================
+    # 读取（检测服务）
+    # ========================
+
+    def _ref(self, seq):
+        begin, end, timestamp = self._slot_header(seq)
+        if begin != seq or end != seq:
+            return None
+        return FrameRef(self, seq, timestamp, self._views[seq % self.slots])
+
+    def read_latest(self, after=0):
+        """
+        读取最新的一帧，跳过中间未处理的帧（检测服务使用此方式保证低延迟）。
+
+        @param after: 上次处理的帧序号，只返回比它新的帧。
+        @return: (FrameRef, 跳过的帧数)；没有新帧时返回 (None, 0)。
+        """
+        seq = self.latest_seq()
+        if seq <= after:
+            return None, 0
+        ref = self._ref(seq)
+        if ref is None:
+            return None, 0
+        return ref, seq - after - 1 if after else 0
+
+    def read_next(self, after):
+        """
+        按顺序读取下一帧；读取方落后超过槽位数时，从仍未被覆盖的最旧帧继续。
+
+        @param after: 上次处理的帧序号。
+        @return: (FrameRef, 被覆盖而丢失的帧数)；没有新帧时返回 (None, 0)。
+        """
+        latest = self.latest_seq()
+        if latest <= after:
+            return None, 0
+        seq = max(after + 1, latest - self.slots + 2)
+        ref = self._ref(seq)
+        return (ref, seq - after - 1) if ref is not None else (None, 0)
+
+    def close(self):
+        """
+        关闭缓冲区；创建方同时删除共享内存名称。
+
+        仍有帧视图存在时（例如推理框架保留了最后一帧输入），映射由这些视图持有，
+        在最后一个视图释放时随 mmap 对象一起解除。关闭后不能再调用读写方法和 FrameRef.valid()。
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._views = []
+        self._data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # 放弃 SharedMemory 对映射的所有权，避免其析构时再次尝试关闭
+            self.shm._mmap = None
+            self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,18 @@
+import os
+import sys
+import time
+
+import pytest
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def shanghai_tz(monkeypatch):
+    """将本地时区切换为 UTC+8（Asia/Shanghai），测试结束后恢复。"""
+    monkeypatch.setenv("TZ", "Asia/Shanghai")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
@@ -0,0 +1,104 @@
+import pytest
+
+from alert_engine import AlertEngine, COALESCE_WINDOW, COOLDOWN, INCIDENT_WINDOW
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def low(species="GoldFish", confidence=0.2):
+    return {"fish_en": species, "confidence": confidence}
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def engine(clock):
+    return AlertEngine({"default": 0.5}, {"GoldFish": "金鱼"}, clock=clock)
+
+
+def test_incident_closed_before_flush_keeps_severity(engine, clock):
+    # 视频处理期间事件循环不会运行 flush，事件在同一合并窗口内开始并结束
+    for _ in range(60):
+        engine.observe("video-1", [low()])
+        clock.now += 0.04
+    engine.close_stream("video-1")
+
+    message = engine.flush()
+    states = [(alert["state"], alert["severity"]) for alert in message["alerts"]]
+    assert states == [("open", "critical"), ("resolved", "critical")]
+    assert message["alert"].startswith("识别度低于阈值的目标数")
+    assert engine.flush() is None
+
+
+def test_incident_lifecycle(engine, clock):
+    assert engine.observe("camera-1", [low(confidence=0.45), {"fish_en": "GoldFish", "confidence": 0.9}]) == 1
+    assert engine.flush() is None
+    clock.now += COALESCE_WINDOW
+    assert [alert["state"] for alert in engine.flush()["alerts"]] == ["open"]
+
+    # 同一事件持续时不重复报警，严重级别升高时报警一次
+    engine.observe("camera-1", [low(confidence=0.45)])
+    clock.now += COALESCE_WINDOW
+    assert engine.flush() is None
+    engine.observe("camera-1", [low(confidence=0.1)])
+    clock.now += COALESCE_WINDOW
+    message = engine.flush()
+    assert [(a["state"], a["severity"]) for a in message["alerts"]] == [("escalated", "critical")]
+
+    # 超时后进入冷却，冷却结束才报告结束
+    clock.now += INCIDENT_WINDOW + 0.1
+    assert engine.flush() is None
+    clock.now += COOLDOWN + 0.1
+    engine.flush()
+    clock.now += COALESCE_WINDOW
+    assert [alert["state"] for alert in engine.flush()["alerts"]] == ["resolved"]
+
+
+def test_threshold_lookup(clock):
+    engine = AlertEngine({
+        "default": 0.5,
+        "species": {"GoldFish": 0.4},
+        "streams": {"camera": {"default": 0.6}, "camera-2": {"species": {"GoldFish": 0.7}}},
+    }, clock=clock)
+    assert engine.threshold_for("image", "BlueTang") == 0.5
+    assert engine.threshold_for("image", "GoldFish") == 0.4
+    assert engine.threshold_for("camera-1", "GoldFish") == 0.6
+    assert engine.threshold_for("camera-2", "GoldFish") == 0.7
+
+
+@pytest.mark.parametrize("rules", [
+    {"streams": [1]},
+    {"species": [0.3]},
+    {"streams": {"camera": {"species": "GoldFish"}}},
+    {"streams": {"camera": 0.5}},
+    {"default": True},
+    {"species": {"GoldFish": 1.5}},
+    [],
+])
+def test_invalid_rules(engine, rules):
+    with pytest.raises(ValueError):
+        engine.set_rules(rules)
+    assert engine.rules["default"] == 0.5
+
+
+def test_connections_with_same_name_have_separate_incidents(clock):
+    engine = AlertEngine({"streams": {"camera-lobby": {"default": 0.9}}}, clock=clock)
+    assert engine.threshold_for("camera-lobby#1", "GoldFish") == 0.9
+    engine.observe("camera-lobby#1", [low(confidence=0.8)])
+    engine.observe("camera-lobby#2", [low(confidence=0.8)])
+    clock.now += COALESCE_WINDOW
+    assert len(engine.flush()["alerts"]) == 2
+
+    engine.close_stream("camera-lobby#1")
+    message = engine.flush()
+    assert [(a["stream"], a["state"]) for a in message["alerts"]] == [("camera-lobby#1", "resolved")]
+    assert ("camera-lobby#2", "GoldFish") in engine.incidents
@@ -0,0 +1,116 @@
+import json
+from datetime import datetime
+
+from analytics import EVENTS, RollupStore, backfill, bucket_key
+
+
+def make_store(tmp_path):
+    return RollupStore(str(tmp_path / "rollups.json"), ["GoldFish", "BlueTang"])
+
+
+def detection(species="GoldFish", confidence=0.9, **extra):
+    return dict(fish_en=species, confidence=confidence, **extra)
+
+
+def test_day_bucket_starts_at_local_midnight(tmp_path, shanghai_tz):
+    store = make_store(tmp_path)
+    store.record("image", [detection()], 0, when=datetime(2025, 4, 15, 7, 30))
+
+    assert bucket_key("day", int(datetime(2025, 4, 15, 7, 30).timestamp())) == \
+        int(datetime(2025, 4, 15).timestamp())
+    summary = store.summary(when=datetime(2025, 4, 15, 10, 0))
+    assert summary["today"]["detections"] == 1
+    series = store.series("day", end=datetime(2025, 4, 15, 10, 0), limit=2)
+    assert [item["time"] for item in series] == ["2025-04-14 00:00:00", "2025-04-15 00:00:00"]
+    assert [item["detections"] for item in series] == [0, 1]
+
+
+def test_version_1_day_keys_are_converted(tmp_path, shanghai_tz):
+    utc_midnight = int(datetime(2025, 4, 15, 8, 0).timestamp())
+    bucket = [1, 2, 0, [2, 0], [0] * 10]
+    data = {"version": 1, "species": ["GoldFish", "BlueTang"],
+            "tables": {"day": {"all": {str(utc_midnight): bucket}}}}
+    (tmp_path / "rollups.json").write_text(json.dumps(data))
+
+    store = make_store(tmp_path)
+    assert list(store.tables["day"]["all"]) == [int(datetime(2025, 4, 15).timestamp())]
+
+
+def test_minute_buckets_are_pruned(tmp_path):
+    store = make_store(tmp_path)
+    store.record("camera", [detection()], 0, when=datetime(2025, 4, 14, 0, 0))
+    store.record("camera", [detection()], 0, when=datetime(2025, 4, 16, 0, 0))
+    assert len(store.tables["minute"]["camera"]) == 1
+    assert len(store.tables["day"]["camera"]) == 2
+
+
+def test_backfill_keeps_camera_and_splits_video_frames(tmp_path):
+    rollup_file = tmp_path / "rollups.json"
+    store = make_store(tmp_path)
+    for _ in range(100):
+        store.record("camera", [detection()], 0, when=datetime(2025, 4, 15, 9, 0))
+    store.record("image", [detection()], 0, when=datetime(2025, 4, 15, 9, 0))
+    store.flush()
+
+    logs = [
+        {"type": "image", "timestamp": "2025 - 04 - 14 21:03:25",
+         "detections": [detection(confidence=0.3)], "alert_count": 1},
+        {"type": "video", "timestamp": "2025-04-14 22:00:00", "total_frames": 23, "total_alert_count": 1,
+         "detections": [detection(frame=0), detection(frame=0), detection("BlueTang", 0.2, frame=10, alert=True)]},
+    ]
+    log_file = tmp_path / "logs.json"
+    log_file.write_text(json.dumps(logs))
+    assert backfill(str(log_file), str(rollup_file)) == 2
+
+    store = make_store(tmp_path)
+    total = store.tables["total"]
+    assert total["camera"][0][0] == 100
+    # 采样帧 0、5、10、15、20 各计一次
+    assert total["video"][0][:3] == [5, 3, 1]
+    assert total["image"][0][:3] == [1, 1, 1]
+    assert total["all"][0][:3] == [106, 104, 2]
+    assert list(store.tables["day"]["all"]) == sorted(store.tables["day"]["all"])
+
+
+def test_series_with_only_start_runs_forward(tmp_path):
+    store = make_store(tmp_path)
+    store.record("image", [detection()], 0, when=datetime(2026, 10, 1, 10, 0))
+
+    series = store.series("hour", start=datetime(2026, 10, 1, 0, 0), end=datetime(2026, 10, 19, 12, 0))
+    assert len(series) == 60
+    assert series[0]["time"] == "2026-10-01 00:00:00"
+    assert series[10]["detections"] == 1
+
+    # 不超过结束时间
+    series = store.series("hour", start=datetime(2026, 10, 1, 0, 0), end=datetime(2026, 10, 1, 11, 30))
+    assert [item["time"] for item in series][-1] == "2026-10-01 11:00:00"
+    assert len(series) == 12
+
+    series = store.series("day", start=datetime(2026, 9, 30), end=datetime(2026, 10, 19), limit=3)
+    assert [item["detections"] for item in series] == [0, 1, 0]
+
+
+def test_journal_persists_only_changed_buckets(tmp_path):
+    store = make_store(tmp_path)
+    store.record("camera", [detection()], 0, when=datetime(2025, 4, 15, 9, 0))
+    store.flush()
+
+    store.record("camera", [detection("BlueTang", 0.3)], 1, when=datetime(2025, 4, 15, 9, 5))
+    generation, line = store.take_changes()
+    # minute、hour、day、total 各一个桶，camera 与 all 两个来源
+    assert len(json.loads(line)["buckets"]) == 8
+    store.append_journal(generation, line)
+    assert store.take_changes() is None
+
+    loaded = make_store(tmp_path)
+    assert loaded.summary("camera", when=datetime(2025, 4, 15, 10, 0)) == \
+        store.summary("camera", when=datetime(2025, 4, 15, 10, 0))
+    assert loaded.journal_lines == 1
+
+    # 重写完整文件后清空日志，之前生成的增量不再写入
+    store.record("camera", [detection()], 0, when=datetime(2025, 4, 15, 9, 6))
+    stale = store.take_changes()
+    store.write_snapshot(*store.take_snapshot())
+    store.append_journal(*stale)
+    assert not (tmp_path / "rollups.json.journal").exists()
+    assert make_store(tmp_path).tables["total"]["camera"][0][EVENTS] == 3
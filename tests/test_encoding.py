@@ -0,0 +1,121 @@
+import base64
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from encoding import EncodeOptions, FrameEncoder, STORAGE_OPTIONS, StreamingVideoWriter
+
+
+def test_options_defaults_and_alias():
+    options = EncodeOptions("JPG", None, None)
+    assert options.to_dict() == {"format": "jpeg", "quality": 80, "scale": 1.0, "mime_type": "image/jpeg"}
+    assert EncodeOptions("none").mime_type is None
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"format": "png"},
+    {"quality": 0},
+    {"quality": 101},
+    {"quality": "abc"},
+    {"quality": float("nan")},
+    {"scale": 0.05},
+    {"scale": 1.5},
+    {"scale": float("nan")},
+])
+def test_options_reject_invalid_values(kwargs):
+    with pytest.raises(ValueError):
+        EncodeOptions(**kwargs)
+
+
+def test_options_equality():
+    assert EncodeOptions("jpg", 90, 1) == STORAGE_OPTIONS
+    assert EncodeOptions("jpeg", 80, 1.0) != STORAGE_OPTIONS
+    assert STORAGE_OPTIONS != STORAGE_OPTIONS.to_dict()
+
+
+def test_encode_formats():
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    jpeg = FrameEncoder(EncodeOptions("jpeg")).encode(frame)
+    assert jpeg[:2] == b"\xff\xd8"
+    webp = FrameEncoder(EncodeOptions("webp", 60)).encode(frame)
+    assert webp[:4] == b"RIFF" and webp[8:12] == b"WEBP"
+    assert base64.b64decode(FrameEncoder().encode_base64(frame))[:2] == b"\xff\xd8"
+
+    encoder = FrameEncoder(EncodeOptions("none"))
+    assert encoder.encode(frame) is None
+    assert encoder.encode_base64(frame) is None
+
+
+def test_resize_buffer_reused_for_same_size():
+    encoder = FrameEncoder(EncodeOptions("jpeg", 80, 0.5))
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    encoder.encode(frame)
+    buffer = encoder._resize_buffer
+    assert buffer.shape == (24, 32, 3)
+    encoder.encode(np.ones((48, 64, 3), dtype=np.uint8))
+    assert encoder._resize_buffer is buffer
+
+    # 分辨率变化时重新分配
+    encoder.encode(np.zeros((40, 60, 3), dtype=np.uint8))
+    assert encoder._resize_buffer is not buffer
+    assert encoder._resize_buffer.shape == (20, 30, 3)
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+    def release(self):
+        pass
+
+
+def test_video_writer_crops_odd_sizes(monkeypatch, tmp_path):
+    opened = []
+    recording = RecordingWriter()
+
+    def fake_open(self, width, height):
+        opened.append((width, height))
+        self._writer = recording
+
+    monkeypatch.setattr(StreamingVideoWriter, "_open", fake_open)
+    writer = StreamingVideoWriter(str(tmp_path / "out.mp4"), 0)
+    assert writer.fps == 25
+    writer.write(np.zeros((33, 65, 3), dtype=np.uint8))
+    writer.write(np.zeros((33, 65, 3), dtype=np.uint8))
+    writer.close()
+
+    assert opened == [(64, 32)]
+    assert [frame.shape for frame in recording.frames] == [(32, 64, 3), (32, 64, 3)]
+    assert all(frame.flags["C_CONTIGUOUS"] for frame in recording.frames)
+    assert writer.frames == 2
+
+
+def test_video_writer_produces_file(tmp_path):
+    path = str(tmp_path / "out.mp4")
+    with StreamingVideoWriter(path, 10) as writer:
+        for value in range(5):
+            writer.write(np.full((32, 48, 3), value * 40, dtype=np.uint8))
+    cap = cv2.VideoCapture(path)
+    assert cap.isOpened()
+    assert int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) == 48
+    cap.release()
+
+
+def test_video_writer_falls_back_when_libx264_missing(monkeypatch, tmp_path):
+    import encoding
+
+    def missing_encoder(self, width, height):
+        raise ValueError("Unknown encoder 'libx264'")
+
+    monkeypatch.setattr(encoding, "_pyav_h264", True)
+    monkeypatch.setattr(StreamingVideoWriter, "_open_av", missing_encoder)
+    with StreamingVideoWriter(str(tmp_path / "out.mp4"), 10) as writer:
+        writer.write(np.zeros((32, 48, 3), dtype=np.uint8))
+        assert writer._writer is not None
+    assert encoding._pyav_h264 is False
+    assert (tmp_path / "out.mp4").stat().st_size > 0
@@ -0,0 +1,106 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("cv2")
+
+from media_store import MediaStore, STALE_TEMP_SECONDS, drop_media_references
+
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # 与服务相同，以相对路径 history_logs 为根目录
+    monkeypatch.chdir(tmp_path)
+    return MediaStore("history_logs", max_bytes=None, max_age_days=None)
+
+
+def write(path, size, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_removes_media_older_than_max_age(store):
+    now = time.time()
+    store.max_age_days = 30
+    old = write("history_logs/images/2025/01/01/old.jpg", 10, now - 40 * DAY)
+    new = write("history_logs/images/2025/02/01/new.jpg", 10, now - 10 * DAY)
+    old_thumb = write(store.thumbnail_path(old), 5, now - 40 * DAY)
+
+    assert store.enforce_retention(now) == {old}
+    assert not os.path.exists(old_thumb)
+    assert os.path.exists(new)
+
+
+def test_size_limit_removes_oldest_first_and_counts_derivatives(store):
+    now = time.time()
+    paths = [write(f"history_logs/videos/2025/03/0{i}/v{i}.mp4", 100, now - (10 - i) * DAY) for i in range(1, 4)]
+    for path in paths:
+        write(store.thumbnail_path(path), 25, now)
+        write(store.preview_path(path), 25, now)
+    # 只算原文件 300 字节未超限，加上衍生文件 450 字节超限
+    store.max_bytes = 320
+
+    assert store.enforce_retention(now) == {paths[0]}
+    assert not os.path.exists(store.thumbnail_path(paths[0]))
+    assert not os.path.exists(store.preview_path(paths[0]))
+    assert all(os.path.exists(path) for path in paths[1:])
+
+
+def test_removes_orphaned_derivatives(store):
+    now = time.time()
+    kept = write("history_logs/images/2025/04/01/kept.jpg", 10, now)
+    kept_thumb = write(store.thumbnail_path(kept), 5, now)
+    orphan_thumb = write(store.thumbnail_path("history_logs/images/2025/04/01/gone.jpg"), 5, now)
+    orphan_preview = write(store.preview_path("history_logs/videos/2025/04/01/gone.mp4"), 5, now)
+
+    assert store.enforce_retention(now) == set()
+    assert os.path.exists(kept_thumb)
+    assert not os.path.exists(orphan_thumb)
+    assert not os.path.exists(orphan_preview)
+
+
+def test_temp_files_removed_only_when_stale(store):
+    now = time.time()
+    fresh = write("history_logs/videos/2025/04/01/fresh.part.mp4", 10, now - 60)
+    stale = write("history_logs/videos/2025/04/01/stale.part.mp4", 10, now - STALE_TEMP_SECONDS - 60)
+    store.max_bytes = 0
+
+    assert store.enforce_retention(now) == set()
+    assert os.path.exists(fresh)
+    assert not os.path.exists(stale)
+
+
+def test_keeps_current_shard_directories(store):
+    today = datetime.now()
+    for when in (today, today - timedelta(days=1)):
+        os.makedirs(f"history_logs/images/{when:%Y/%m/%d}", exist_ok=True)
+    os.makedirs("history_logs/images/2020/01/01")
+
+    store.enforce_retention()
+    for when in (today, today - timedelta(days=1)):
+        assert os.path.isdir(f"history_logs/images/{when:%Y/%m/%d}")
+    assert not os.path.exists("history_logs/images/2020")
+
+
+def test_drop_media_references_handles_legacy_paths(store):
+    removed = {"history_logs/images/20250414210325.jpg", "history_logs/videos/2025/04/15/abc.mp4"}
+    logs = [
+        {"type": "image", "marked_image_path": "history_logs\\images\\20250414210325.jpg", "alert_count": 1},
+        {"type": "video", "marked_video_path": "history_logs/videos/2025/04/15/abc.mp4",
+         "thumbnail_path": "history_logs/thumbs/videos/2025/04/15/abc.jpg",
+         "preview_path": "history_logs/previews/videos/2025/04/15/abc.mp4"},
+        {"type": "image", "marked_image_path": "history_logs/images/2025/04/15/kept.jpg"},
+    ]
+
+    assert drop_media_references(logs, removed)
+    assert logs[0] == {"type": "image", "marked_image_path": None, "alert_count": 1}
+    assert logs[1] == {"type": "video", "marked_video_path": None}
+    assert logs[2]["marked_image_path"] == "history_logs/images/2025/04/15/kept.jpg"
+    assert not drop_media_references(logs, removed)
@@ -0,0 +1,153 @@
+import inspect
+import struct
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pytest
+
+import shm_ring
+from shm_ring import SharedFrameRing
+
+
+@pytest.fixture
+def rings():
+    name = f"test-ring-{uuid.uuid4().hex[:8]}"
+    writer = SharedFrameRing.create(name, 4, 3, slots=4)
+    reader = SharedFrameRing.attach(name)
+    if "track" not in inspect.signature(shared_memory.SharedMemory).parameters:
+        # Python 3.13 之前附加方取消登记时会一并取消同一进程中创建方的登记，这里重新登记
+        resource_tracker.register(writer.shm._name, "shared_memory")
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def frame(value):
+    return np.full((3, 4, 3), value, dtype=np.uint8)
+
+
+def test_read_latest_is_zero_copy_and_counts_dropped(rings):
+    writer, reader = rings
+    assert reader.read_latest() == (None, 0)
+
+    writer.write(frame(1), timestamp=10.0)
+    ref, dropped = reader.read_latest()
+    assert (ref.seq, dropped, ref.timestamp) == (1, 0, 10.0)
+    assert ref.frame[0, 0, 0] == 1
+    assert reader.read_latest(ref.seq) == (None, 0)
+
+    for value in range(2, 6):
+        writer.write(frame(value))
+    ref, dropped = reader.read_latest(1)
+    assert (ref.seq, dropped) == (5, 3)
+    assert ref.frame[0, 0, 0] == 5
+
+    # 视图直接指向共享内存，生产者写入后读取方立即可见
+    for value in range(6, 9):
+        writer.write(frame(value))
+    seq, view = writer.begin_write()
+    view[...] = 9
+    assert ref.frame[0, 0, 0] == 9
+
+
+def test_valid_detects_overwrite(rings):
+    writer, reader = rings
+    writer.write(frame(1))
+    ref, _ = reader.read_latest()
+    assert ref.valid()
+
+    # 开始覆盖同一槽位时即失效，提交后仍然失效
+    for value in range(2, 5):
+        writer.write(frame(value))
+    seq, view = writer.begin_write()
+    assert seq == 5
+    assert not ref.valid()
+    assert reader.read_latest(4) == (None, 0)
+    writer.commit(seq)
+    assert not ref.valid()
+    assert reader.read_latest(4)[0].seq == 5
+
+
+def test_read_next_skips_overwritten_frames(rings):
+    writer, reader = rings
+    for value in range(1, 11):
+        writer.write(frame(value))
+    ref, dropped = reader.read_next(0)
+    # 4个槽位中最旧的一个可能正在被覆盖，从仍完整的最旧帧继续
+    assert (ref.seq, dropped) == (8, 7)
+    assert reader.read_next(8)[0].frame[0, 0, 0] == 9
+    assert reader.read_next(10) == (None, 0)
+
+
+def test_attach_missing_ring():
+    with pytest.raises(FileNotFoundError):
+        SharedFrameRing.attach(f"missing-{uuid.uuid4().hex[:8]}")
+
+
+def test_close_keeps_mapping_while_views_alive(rings):
+    writer, reader = rings
+    writer.write(frame(3))
+    ref, _ = reader.read_latest()
+    kept = ref.frame[1:]
+    del ref
+    reader.close()
+    assert reader.closed
+    # 映射由保留的视图持有，关闭后仍可安全访问
+    writer.write(frame(4))
+    assert kept[0, 0, 0] == 3
+    reader.close()
+
+
+@pytest.fixture
+def raw_segment():
+    segments = []
+
+    def make(size, header=None):
+        shm = shared_memory.SharedMemory(name=f"test-raw-{uuid.uuid4().hex[:8]}", create=True, size=size)
+        if header is not None:
+            struct.pack_into(shm_ring.HEADER_FORMAT, shm.buf, 0, *header)
+        segments.append(shm)
+        return shm
+
+    yield make
+    for shm in segments:
+        shm.close()
+        shm.unlink()
+
+
+def test_rejects_segment_smaller_than_header(raw_segment):
+    shm = raw_segment(16)
+    with pytest.raises(ValueError):
+        SharedFrameRing(shm, owner=False)
+    assert shm.buf is None
+
+
+def test_rejects_bad_magic(raw_segment):
+    shm = raw_segment(shm_ring.HEADER_SIZE, (b"NOPE", shm_ring.VERSION, 2, 4, 3, 3, 128, 0))
+    with pytest.raises(ValueError):
+        SharedFrameRing(shm, owner=False)
+    assert shm.buf is None
+
+
+def test_rejects_segment_smaller_than_slots(raw_segment):
+    # 文件头声明8个槽位，但共享内存只容纳文件头
+    shm = raw_segment(shm_ring.HEADER_SIZE, (shm_ring.MAGIC, shm_ring.VERSION, 8, 4, 3, 3, 128, 0))
+    with pytest.raises(ValueError):
+        SharedFrameRing(shm, owner=False)
+    assert shm.buf is None
+
+
+@pytest.mark.parametrize("slots", [0, 1])
+def test_create_requires_two_slots(slots):
+    with pytest.raises(ValueError):
+        SharedFrameRing.create(f"test-ring-{uuid.uuid4().hex[:8]}", 4, 3, slots=slots)
+
+
+@pytest.mark.parametrize("slots", ["0", "1"])
+def test_producer_rejects_too_few_slots(slots):
+    pytest.importorskip("cv2")
+    import shm_producer
+
+    with pytest.raises(SystemExit):
+        shm_producer.parse_args(["video.mp4", "--slots", slots])